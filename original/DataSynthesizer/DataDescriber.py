@@ -1,20 +1,47 @@
 import json
+from copy import deepcopy
 
+from multiprocessing import Pool
 from pathlib import Path
 from typing import Dict, List, Union
 
-from numpy import array_equal
-from pandas import DataFrame, read_csv
+import numpy as np
+from pandas import DataFrame, RangeIndex, Series, concat, read_csv, read_parquet
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
 
+from original.DataSynthesizer.DataGenerator import DataGenerator
+from original.DataSynthesizer.ModelCache import ModelCache, hash_file
 from original.DataSynthesizer.datatypes import AbstractAttribute
-from original.DataSynthesizer.datatypes import is_datetime, DateTimeAttribute
+from original.DataSynthesizer.datatypes import are_datetimes, DateTimeAttribute, parse_json
 from original.DataSynthesizer.datatypes.FloatAttribute import FloatAttribute
 from original.DataSynthesizer.datatypes.IntegerAttribute import IntegerAttribute
-from original.DataSynthesizer.datatypes.SocialSecurityNumberAttribute import is_ssn, SocialSecurityNumberAttribute
+from original.DataSynthesizer.datatypes.SocialSecurityNumberAttribute import are_ssns, SocialSecurityNumberAttribute
 from original.DataSynthesizer.datatypes.StringAttribute import StringAttribute
+from original.DataSynthesizer.datatypes.utils.ColumnStatistics import ColumnStatistics
 from original.DataSynthesizer.datatypes.utils.DataType import DataType
 from DataSynthesizer.lib import utils
-from DataSynthesizer.lib.PrivBayes import greedy_bayes, construct_noisy_conditional_distributions
+from src.original_priv_bayes import greedy_bayes, construct_noisy_conditional_distributions, \
+    conditional_distributions_to_json, encode_dataset_into_codes, JointCountsCache
+
+
+def infer_data_type(paras):
+    """Infer the data type of the non-missing values of an attribute, or of a sample of them if it is not numerical."""
+    values, is_numerical = paras
+
+    # current attribute is either Integer or Float.
+    if is_numerical:
+        if np.all(np.mod(values.to_numpy(), 1) == 0):
+            return DataType.INTEGER
+        return DataType.FLOAT
+
+    # current attribute is either String, DateTime, or SocialSecurityNumber.
+    if values.empty:
+        return DataType.STRING
+    if are_datetimes(values).all():
+        return DataType.DATETIME
+    if are_ssns(values).all():
+        return DataType.SOCIAL_SECURITY_NUMBER
+    return DataType.STRING
 
 
 class DataDescriber:
@@ -44,14 +71,36 @@ class DataDescriber:
         Dictionary of {attribute: AbstractAttribute}
     bayesian_network : list
         List of [child, [parent,]] to represent a Bayesian Network.
+    conditional_distributions : dict
+        Dictionary of {attribute: array} of the noisy conditional distributions in the Bayesian Network, which are
+        converted into JSON only when the description is saved or displayed.
     df_encoded : DataFrame
         Input dataset encoded into integers, taken as input by PrivBayes algorithm in correlated attribute mode.
+    chunksize : int
+        Number of rows read at once from the dataset file. If set, the dataset is never loaded in memory: df_input has
+        no rows, and the attributes are described from attr_to_value_counts, accumulated in a single pass over the
+        chunks. Correlated attribute mode encodes the dataset in a second pass.
+    dtype : dict
+        Dictionary of {attribute: dtype} of the attributes read from the dataset file, e.g., {"zip": str}.
+    attr_to_value_counts : dict
+        Dictionary of {attribute: Series} of the number of rows of each distinct value, including missing values, if
+        the dataset is read in chunks.
+    attr_to_statistics : dict
+        Dictionary of {attribute: ColumnStatistics}, computed once per attribute by get_statistics.
+    model_cache : ModelCache
+        Cache of the descriptions in correlated attribute mode. If set, describing an unchanged dataset file with
+        unchanged parameters and a given seed loads the cached description, and only restores data_description,
+        attr_to_column and bayesian_network.
     """
 
-    def __init__(self, histogram_bins: Union[int, str] = 20, category_threshold=20, null_values=None):
+    def __init__(self, histogram_bins: Union[int, str] = 20, category_threshold=20, null_values=None, chunksize=None,
+                 dtype=None, model_cache: ModelCache = None):
         self.histogram_bins: Union[int, str] = histogram_bins
         self.category_threshold: int = category_threshold
         self.null_values = null_values
+        self.chunksize: int = chunksize
+        self.dtype: Dict = dtype
+        self.model_cache: ModelCache = model_cache
 
         self.attr_to_datatype: Dict[str, DataType] = None
         self.attr_to_is_categorical: Dict[str, bool] = None
@@ -61,7 +110,12 @@ class DataDescriber:
         self.df_input: DataFrame = None
         self.attr_to_column: Dict[str, AbstractAttribute] = None
         self.bayesian_network: List = None
+        self.conditional_distributions: Dict = None
         self.df_encoded: DataFrame = None
+        self.attr_to_value_counts: Dict[str, Series] = None
+        self.attr_to_statistics: Dict[str, ColumnStatistics] = {}
+        self.dataset_file = None
+        self.encoding = None
 
     def describe_dataset_in_random_mode(self,
                                         dataset_file: str,
@@ -82,6 +136,7 @@ class DataDescriber:
             categorical_attribute_to_domain = {}
 
         utils.set_random_seed(seed)
+        self.attr_to_statistics = {}
         self.attr_to_datatype = {attr: DataType(datatype) for attr, datatype in attribute_to_datatype.items()}
         self.attr_to_is_categorical = attribute_to_is_categorical
         self.attr_to_is_candidate_key = attribute_to_is_candidate_key
@@ -139,7 +194,8 @@ class DataDescriber:
                                                       attribute_to_is_candidate_key: Dict[str, bool] = None,
                                                       categorical_attribute_domain_file: str = None,
                                                       numerical_attribute_ranges: Dict[str, List] = None,
-                                                      seed=0):
+                                                      seed=0,
+                                                      num_workers=1):
         """Generate dataset description using correlated attribute mode.
 
         Parameters
@@ -163,7 +219,24 @@ class DataDescriber:
             Dictionary of {attribute: [min, max]}, e.g., {"age": [25, 65]}
         seed : int or float
             Seed the random number generator.
+        num_workers : int
+            Number of threads constructing the conditional distributions of the Bayesian Network concurrently, see
+            construct_noisy_conditional_distributions. The description does not depend on it.
         """
+        cache_key = None
+        if self.model_cache is not None and seed is not None:
+            cache_key = self.get_cache_key(dataset_file, k=k, epsilon=epsilon,
+                                           attribute_to_datatype=attribute_to_datatype,
+                                           attribute_to_is_categorical=attribute_to_is_categorical,
+                                           attribute_to_is_candidate_key=attribute_to_is_candidate_key,
+                                           categorical_attribute_domain_file=categorical_attribute_domain_file,
+                                           numerical_attribute_ranges=numerical_attribute_ranges,
+                                           seed=seed)
+            description = self.model_cache.load(cache_key)
+            if description is not None:
+                self.load_cached_description(description)
+                return
+
         self.describe_dataset_in_independent_attribute_mode(dataset_file,
                                                             epsilon,
                                                             attribute_to_datatype,
@@ -176,16 +249,132 @@ class DataDescriber:
         if self.df_encoded.shape[1] < 2:
             raise Exception("Correlated Attribute Mode requires at least 2 attributes(i.e., columns) in dataset.")
 
-        self.bayesian_network = greedy_bayes(self.df_encoded, k, epsilon / 2, seed=seed)
+        # the joint counts of the edges are kept from the BN construction for the conditional distributions
+        counts_cache = JointCountsCache()
+        self.bayesian_network = greedy_bayes(self.df_encoded, k, epsilon / 2, seed=seed, counts_cache=counts_cache)
         self.data_description['bayesian_network'] = self.bayesian_network
-        self.data_description['conditional_probabilities'] = construct_noisy_conditional_distributions(
-            self.bayesian_network, self.df_encoded, epsilon / 2)
+        # the noise of each child is drawn from its own random state, spawned from the seed of the conditional
+        # distributions, whatever num_workers
+        conditional_seed = np.random.randint(2 ** 31) if seed is None else seed
+        self.conditional_distributions = construct_noisy_conditional_distributions(self.bayesian_network,
+                                                                                   self.df_encoded, epsilon / 2,
+                                                                                   counts_cache=counts_cache,
+                                                                                   seed=conditional_seed,
+                                                                                   num_workers=num_workers)
+        if cache_key is not None:
+            self.record_conditional_distributions_in_description()
+            self.model_cache.save(cache_key, self.data_description)
+
+    def describe_dataset_in_correlated_attribute_mode_for_epsilons(self,
+                                                                   dataset_file,
+                                                                   epsilons: List[float],
+                                                                   k=0,
+                                                                   attribute_to_datatype: Dict[str, DataType] = None,
+                                                                   attribute_to_is_categorical: Dict[str, bool] = None,
+                                                                   attribute_to_is_candidate_key: Dict[str, bool] = None,
+                                                                   categorical_attribute_domain_file: str = None,
+                                                                   numerical_attribute_ranges: Dict[str, List] = None,
+                                                                   seed=0):
+        """Generate dataset descriptions using correlated attribute mode at several epsilons, e.g., to pick a trade-off
+        between privacy and utility.
+
+        The dataset is read, described and encoded once. Only the steps injecting noise are repeated for each epsilon,
+        i.e., the Laplace noise of the attribute distributions, the Exponential Mechanism of greedy_bayes and the
+        Laplace noise of the conditional distributions. The MI of the candidate (child, parents) pairs and the exact
+        joint counts are computed once, and shared by all epsilons.
+
+        Parameters
+        ----------
+        epsilons : list
+            Values of epsilon, see describe_dataset_in_correlated_attribute_mode.
+        seed : int
+            Seed the random number generator. Each epsilon gets its own seed spawned from it, so that the noises of
+            different epsilons are independent.
+
+        See describe_dataset_in_correlated_attribute_mode for the other parameters.
+
+        Return
+        --------
+        dict
+            Dictionary of {epsilon: dataset description}, including the conditional distributions. The describer is
+            left in the state of the last epsilon.
+        """
+        self.describe_dataset_in_random_mode(dataset_file,
+                                             attribute_to_datatype,
+                                             attribute_to_is_categorical,
+                                             attribute_to_is_candidate_key,
+                                             categorical_attribute_domain_file,
+                                             numerical_attribute_ranges,
+                                             seed=seed)
+        for column in self.attr_to_column.values():
+            column.infer_distribution()
+        attr_to_distribution = {attr: column.distribution_probabilities for attr, column in self.attr_to_column.items()}
+
+        self.df_encoded = self.encode_dataset_into_binning_indices()
+        if self.df_encoded.shape[1] < 2:
+            raise Exception("Correlated Attribute Mode requires at least 2 attributes(i.e., columns) in dataset.")
+        codes, cardinalities = encode_dataset_into_codes(self.df_encoded)
+        mi_cache = {}
+        counts_cache = JointCountsCache()
+
+        descriptions = {}
+        epsilon_seeds = np.random.SeedSequence(seed).spawn(len(epsilons))
+        for epsilon, epsilon_seed in zip(epsilons, epsilon_seeds):
+            epsilon_seed = int(epsilon_seed.generate_state(1)[0])
+            utils.set_random_seed(epsilon_seed)
+            for attr, column in self.attr_to_column.items():
+                column.distribution_probabilities = attr_to_distribution[attr]
+            self.inject_laplace_noise_into_distribution_per_attribute(epsilon)
+            self.data_description['attribute_description'] = {attr: column.to_json()
+                                                              for attr, column in self.attr_to_column.items()}
+
+            self.bayesian_network = greedy_bayes(self.df_encoded, k, epsilon / 2, seed=epsilon_seed, codes=codes,
+                                                 cardinalities=cardinalities, mi_cache=mi_cache,
+                                                 counts_cache=counts_cache)
+            self.data_description['bayesian_network'] = self.bayesian_network
+            self.conditional_distributions = construct_noisy_conditional_distributions(
+                self.bayesian_network, self.df_encoded, epsilon / 2, counts_cache=counts_cache, seed=epsilon_seed)
+            self.record_conditional_distributions_in_description()
+            descriptions[epsilon] = deepcopy(self.data_description)
+        return descriptions
+
+    def get_cache_key(self, dataset_file, **parameters):
+        """Key of model_cache, from the content of the dataset file and of the domain file, and all parameters."""
+        parameters.update(mode='correlated_attribute_mode',
+                          histogram_bins=self.histogram_bins,
+                          category_threshold=self.category_threshold,
+                          null_values=self.null_values,
+                          chunksize=self.chunksize,
+                          dtype=self.dtype)
+        domain_file = parameters['categorical_attribute_domain_file']
+        if domain_file:
+            parameters['categorical_attribute_domain_file'] = hash_file(domain_file)
+        return ModelCache.make_key(dataset_file, parameters)
+
+    def load_cached_description(self, description):
+        self.data_description = description
+        self.attr_to_column = {attr: parse_json(attr_in_json)
+                               for attr, attr_in_json in description['attribute_description'].items()}
+        self.bayesian_network = [(child, parents) for child, parents in description['bayesian_network']]
+        self.data_description['bayesian_network'] = self.bayesian_network
+        self.conditional_distributions = None
 
     def read_dataset_from_csv(self, file_name=None):
+        # the statistics of the previously read dataset, if any, are stale
+        self.attr_to_statistics = {}
+        if self.chunksize:
+            self.read_dataset_in_chunks(file_name)
+            return
+        if Path(file_name).suffix == '.parquet':
+            self.df_input = read_parquet(file_name)
+            if self.dtype:
+                self.df_input = self.df_input.astype(self.dtype)
+            return
+
         try:
-            self.df_input = read_csv(file_name, skipinitialspace=True, na_values=self.null_values)
+            self.df_input = read_csv(file_name, skipinitialspace=True, na_values=self.null_values, dtype=self.dtype)
         except (UnicodeDecodeError, NameError):
-            self.df_input = read_csv(file_name, skipinitialspace=True, na_values=self.null_values,
+            self.df_input = read_csv(file_name, skipinitialspace=True, na_values=self.null_values, dtype=self.dtype,
                                      encoding='latin1')
 
         # Remove columns with empty active domain, i.e., all values are missing.
@@ -195,32 +384,88 @@ class DataDescriber:
         if len(attributes_before) > len(attributes_after):
             print(f'Empty columns are removed, including {attributes_before - attributes_after}.')
 
-    def infer_attribute_data_types(self):
-        attributes_with_unknown_datatype = set(self.df_input.columns) - set(self.attr_to_datatype)
-        inferred_numerical_attributes = utils.infer_numerical_attributes_in_dataframe(self.df_input)
+    def read_dataset_in_chunks(self, file_name):
+        """Count the distinct values of each attribute in a single pass over the chunks of the dataset file.
 
-        for attr in attributes_with_unknown_datatype:
-            column_dropna = self.df_input[attr].dropna()
+        The file is read again in latin1 only if it turns out not to be in UTF-8.
+        """
+        for encoding in [None, 'latin1']:
+            try:
+                self.df_input = None
+                self.attr_to_value_counts = {}
+                for chunk in self.read_chunks(file_name, encoding):
+                    if self.df_input is None:
+                        self.df_input = chunk.iloc[:0]
+                    for attr in chunk:
+                        value_counts = chunk[attr].value_counts(dropna=False, sort=False)
+                        if attr in self.attr_to_value_counts:
+                            value_counts = concat([self.attr_to_value_counts[attr], value_counts])
+                            value_counts = value_counts.groupby(level=0, dropna=False, sort=False).sum()
+                        self.attr_to_value_counts[attr] = value_counts
+                self.dataset_file = file_name
+                self.encoding = encoding
+                return
+            except UnicodeDecodeError:
+                if encoding:
+                    raise
+
+    def read_chunks(self, file_name, encoding=None):
+        """Read the dataset file chunk by chunk, from a Parquet file if file_name ends with .parquet, and from a CSV
+        file otherwise.
+        """
+        if Path(file_name).suffix == '.parquet':
+            try:
+                from pyarrow import parquet
+            except ImportError:
+                raise Exception('Reading Parquet files requires pyarrow.')
+
+            for batch in parquet.ParquetFile(file_name).iter_batches(batch_size=self.chunksize):
+                chunk = batch.to_pandas()
+                yield chunk.astype(self.dtype) if self.dtype else chunk
+        else:
+            yield from read_csv(file_name, skipinitialspace=True, na_values=self.null_values, dtype=self.dtype,
+                                encoding=encoding, chunksize=self.chunksize)
 
-            # current attribute is either Integer or Float.
-            if attr in inferred_numerical_attributes:
-                # TODO Comparing all values may be too slow for large datasets.
-                if array_equal(column_dropna, column_dropna.astype(int, copy=False)):
-                    self.attr_to_datatype[attr] = DataType.INTEGER
-                else:
-                    self.attr_to_datatype[attr] = DataType.FLOAT
+    def get_column(self, attr):
+        """Values of an attribute, which are its distinct values if the dataset is read in chunks."""
+        if self.attr_to_value_counts is None:
+            return self.df_input[attr]
+        return self.attr_to_value_counts[attr].index.to_series(index=RangeIndex(len(self.attr_to_value_counts[attr])),
+                                                               name=attr).infer_objects()
 
-            # current attribute is either String, DateTime, or SocialSecurityNumber.
+    def get_num_tuples(self):
+        if self.attr_to_value_counts is None:
+            return self.df_input.shape[0]
+        return int(next(iter(self.attr_to_value_counts.values())).sum()) if self.attr_to_value_counts else 0
+
+    def infer_attribute_data_types(self, sample_size=1000, num_workers=1):
+        """Infer the data types of the attributes without a given data type.
+
+        Parameters
+        ----------
+        sample_size : int
+            Number of values sampled from each non-numerical attribute to test whether it is a DateTime or a
+            SocialSecurityNumber.
+        num_workers : int
+            Number of processes inferring the data types of the attributes in parallel.
+        """
+        attributes_with_unknown_datatype = [attr for attr in self.df_input if attr not in self.attr_to_datatype]
+        tasks = []
+        for attr in attributes_with_unknown_datatype:
+            column_dropna = self.get_column(attr).dropna()
+            if is_numeric_dtype(column_dropna) and not is_bool_dtype(column_dropna):
+                tasks.append((column_dropna, True))
             else:
-                # Sample 20 values to test its data_type.
-                samples = column_dropna.sample(20, replace=True)
-                if all(samples.map(is_datetime)):
-                    self.attr_to_datatype[attr] = DataType.DATETIME
-                else:
-                    if all(samples.map(is_ssn)):
-                        self.attr_to_datatype[attr] = DataType.SOCIAL_SECURITY_NUMBER
-                    else:
-                        self.attr_to_datatype[attr] = DataType.STRING
+                # a fixed sample, which leaves the random state of the noise alone, whether the dataset is read at once
+                # or in chunks, where the column only has the distinct values
+                tasks.append((column_dropna.sample(min(sample_size, column_dropna.size), random_state=0), False))
+
+        if num_workers > 1:
+            with Pool(num_workers) as pool:
+                data_types = pool.map(infer_data_type, tasks)
+        else:
+            data_types = map(infer_data_type, tasks)
+        self.attr_to_datatype.update(zip(attributes_with_unknown_datatype, data_types))
 
     def analyze_dataset_meta(self):
         all_attributes = set(self.df_input.columns)
@@ -230,7 +475,7 @@ class DataDescriber:
             if self.attr_to_datatype[attr] in {DataType.FLOAT, DataType.DATETIME}:
                 self.attr_to_is_candidate_key[attr] = False
             else:
-                self.attr_to_is_candidate_key[attr] = self.df_input[attr].is_unique
+                self.attr_to_is_candidate_key[attr] = self.get_statistics(attr).is_unique
 
         candidate_keys = {attr for attr, is_key in self.attr_to_is_candidate_key.items() if is_key}
 
@@ -247,7 +492,7 @@ class DataDescriber:
                             attr not in candidate_keys and attr not in non_categorical_string_attributes]
         non_categorical_string_attributes = list(non_categorical_string_attributes)
 
-        self.data_description['meta'] = {"num_tuples": self.df_input.shape[0],
+        self.data_description['meta'] = {"num_tuples": self.get_num_tuples(),
                                          "num_attributes": self.df_input.shape[1],
                                          "num_attributes_in_BN": len(attributes_in_BN),
                                          "all_attributes": self.df_input.columns.tolist(),
@@ -265,7 +510,16 @@ class DataDescriber:
         if attribute_name in self.attr_to_is_categorical:
             return self.attr_to_is_categorical[attribute_name]
         else:
-            return self.df_input[attribute_name].dropna().unique().size <= self.category_threshold
+            return self.get_statistics(attribute_name).num_distinct <= self.category_threshold
+
+    def get_statistics(self, attr):
+        """Statistics of an attribute, computed in a single pass over its values at the first call."""
+        if attr not in self.attr_to_statistics:
+            if self.attr_to_value_counts is None:
+                self.attr_to_statistics[attr] = ColumnStatistics.from_column(self.df_input[attr])
+            else:
+                self.attr_to_statistics[attr] = ColumnStatistics.from_value_counts(self.attr_to_value_counts[attr])
+        return self.attr_to_statistics[attr]
 
     def represent_input_dataset_by_columns(self):
         self.attr_to_column = {}
@@ -273,7 +527,8 @@ class DataDescriber:
             data_type = self.attr_to_datatype[attr]
             is_candidate_key = self.attr_to_is_candidate_key[attr]
             is_categorical = self.attr_to_is_categorical[attr]
-            paras = (attr, is_candidate_key, is_categorical, self.histogram_bins, self.df_input[attr])
+            counts = None if self.attr_to_value_counts is None else self.attr_to_value_counts[attr].to_numpy()
+            paras = (attr, is_candidate_key, is_categorical, self.histogram_bins, self.get_column(attr), counts)
             if data_type is DataType.INTEGER:
                 self.attr_to_column[attr] = IntegerAttribute(*paras)
             elif data_type is DataType.FLOAT:
@@ -286,6 +541,7 @@ class DataDescriber:
                 self.attr_to_column[attr] = SocialSecurityNumberAttribute(*paras)
             else:
                 raise Exception(f'The DataType of {attr} is unknown.')
+            self.attr_to_column[attr].statistics = self.get_statistics(attr)
 
     def inject_laplace_noise_into_distribution_per_attribute(self, epsilon=0.1):
         num_attributes_in_BN = self.data_description['meta']['num_attributes_in_BN']
@@ -294,16 +550,54 @@ class DataDescriber:
             column.inject_laplace_noise(epsilon, num_attributes_in_BN)
 
     def encode_dataset_into_binning_indices(self):
-        """Before constructing Bayesian network, encode input dataset into binning indices."""
-        encoded_dataset = DataFrame()
-        for attr in self.data_description['meta']['attributes_in_BN']:
-            encoded_dataset[attr] = self.attr_to_column[attr].encode_values_into_bin_idx()
-        return encoded_dataset
+        """Before constructing Bayesian network, encode input dataset into binning indices.
+
+        The encoded dataset is backed by a single Fortran-ordered array, in the smallest integer dtype of all indices.
+        """
+        attributes = self.data_description['meta']['attributes_in_BN']
+        if self.attr_to_value_counts is not None:
+            return self.encode_dataset_in_chunks_into_binning_indices(attributes)
+
+        encoded_columns = [self.attr_to_column[attr].encode_values_into_bin_idx() for attr in attributes]
+        dtype = np.result_type(*encoded_columns) if encoded_columns else np.uint8
+        encoded_dataset = np.empty((self.df_input.shape[0], len(attributes)), dtype=dtype, order='F')
+        for idx, encoded_column in enumerate(encoded_columns):
+            encoded_dataset[:, idx] = encoded_column
+        return DataFrame(encoded_dataset, index=self.df_input.index, columns=attributes, copy=False)
+
+    def encode_dataset_in_chunks_into_binning_indices(self, attributes):
+        """Encode the dataset read in chunks, in a second pass over the dataset file."""
+        max_bin_idx = max(len(self.attr_to_column[attr].distribution_bins) for attr in attributes)
+        # values out of the numerical range of an attribute are encoded as -1
+        encoded_dataset = np.empty((self.get_num_tuples(), len(attributes)), dtype=np.min_scalar_type(-max_bin_idx - 1),
+                                   order='F')
+        start = 0
+        for chunk in self.read_chunks(self.dataset_file, self.encoding):
+            for idx, attr in enumerate(attributes):
+                encoded_dataset[start:start + chunk.shape[0], idx] = self.attr_to_column[attr].encode_values(chunk[attr])
+            start += chunk.shape[0]
+        return DataFrame(encoded_dataset, columns=attributes, copy=False)
+
+    def record_conditional_distributions_in_description(self):
+        """Convert the conditional distributions of the Bayesian Network into JSON in the dataset description."""
+        if self.conditional_distributions is not None:
+            self.data_description['conditional_probabilities'] = conditional_distributions_to_json(
+                self.bayesian_network, self.conditional_distributions)
 
     def save_dataset_description_to_file(self, file_name):
+        self.record_conditional_distributions_in_description()
         Path(file_name).touch()
         with open(file_name, 'w') as outfile:
             json.dump(self.data_description, outfile, indent=4)
 
+    def save_compiled_model_to_file(self, directory):
+        """Save the description with the Bayesian Network compiled for sampling, see DataGenerator.save_compiled_model.
+
+        DataGenerator memory-maps the directory in correlated attribute mode, instead of parsing the JSON description.
+        """
+        self.record_conditional_distributions_in_description()
+        DataGenerator.save_compiled_model(self.data_description, directory)
+
     def display_dataset_description(self):
+        self.record_conditional_distributions_in_description()
         print(json.dumps(self.data_description, indent=4))
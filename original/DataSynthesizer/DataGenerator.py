@@ -1,10 +1,40 @@
+import json
+from collections import deque
+from multiprocessing import Pool
 from pathlib import Path
 
+import numpy as np
 from numpy import random
-from pandas import DataFrame
+from pandas import DataFrame, concat
 
 from original.DataSynthesizer.datatypes import parse_json
-from DataSynthesizer.lib.utils import set_random_seed, read_json_file, generate_random_string
+from original.DataSynthesizer.datatypes.StringAttribute import generate_random_strings
+from DataSynthesizer.lib.utils import read_json_file
+from src.original_priv_bayes import MAX_DENSE_CELLS, compile_distribution_table, sample_child
+from src.sparse import domain_size, unlisted_parents_distribution
+
+# Number of rows generated at once in correlated attribute mode.
+CHUNK_SIZE = 100000
+
+# Shared by all chunks of a synthetic dataset, and set once per worker process (see DataGenerator.map_chunks).
+_generator_state = None
+
+
+def _init_worker(generator_state):
+    global _generator_state
+    _generator_state = generator_state
+
+
+def _generate_chunk(paras):
+    start, stop, chunk_seed = paras
+    return DataGenerator.generate_chunk(_generator_state, start, stop, chunk_seed)
+
+
+def _write_chunk(paras):
+    start, stop, chunk_seed, to_file = paras
+    _, synthetic_chunk = DataGenerator.generate_chunk(_generator_state, start, stop, chunk_seed)
+    DataGenerator.save_chunks([synthetic_chunk], to_file)
+    return to_file
 
 
 class DataGenerator(object):
@@ -15,7 +45,7 @@ class DataGenerator(object):
         self.encoded_dataset = None
 
     def generate_dataset_in_random_mode(self, n, description_file, seed=0, minimum=0, maximum=100):
-        set_random_seed(seed)
+        rng = random.default_rng(seed)
         description = read_json_file(description_file)
 
         self.synthetic_dataset = DataFrame()
@@ -25,21 +55,21 @@ class DataGenerator(object):
             is_categorical = attr_info['is_categorical']
             is_candidate_key = attr_info['is_candidate_key']
             if is_candidate_key:
-                self.synthetic_dataset[attr] = parse_json(attr_info).generate_values_as_candidate_key(n)
+                self.synthetic_dataset[attr] = parse_json(attr_info).generate_values_as_candidate_key(n, seed=seed,
+                                                                                                      rng=rng)
             elif is_categorical:
-                self.synthetic_dataset[attr] = random.choice(attr_info['distribution_bins'], n)
+                self.synthetic_dataset[attr] = rng.choice(attr_info['distribution_bins'], n)
             elif datatype == 'String':
-                length = random.randint(attr_info['min'], attr_info['max'] + 1)
-                self.synthetic_dataset[attr] = length
-                self.synthetic_dataset[attr] = self.synthetic_dataset[attr].map(lambda x: generate_random_string(x))
+                length = rng.integers(attr_info['min'], attr_info['max'] + 1)
+                self.synthetic_dataset[attr] = generate_random_strings(np.full(n, length), rng)
             else:
                 if datatype == 'Integer':
-                    self.synthetic_dataset[attr] = random.randint(minimum, maximum + 1, n)
+                    self.synthetic_dataset[attr] = rng.integers(minimum, maximum + 1, n)
                 else:
-                    self.synthetic_dataset[attr] = random.uniform(minimum, maximum, n)
+                    self.synthetic_dataset[attr] = rng.uniform(minimum, maximum, n)
 
     def generate_dataset_in_independent_mode(self, n, description_file, seed=0):
-        set_random_seed(seed)
+        rng = random.default_rng(seed)
         self.description = read_json_file(description_file)
 
         all_attributes = self.description['meta']['all_attributes']
@@ -50,32 +80,137 @@ class DataGenerator(object):
             column = parse_json(attr_info)
 
             if attr in candidate_keys:
-                self.synthetic_dataset[attr] = column.generate_values_as_candidate_key(n)
+                self.synthetic_dataset[attr] = column.generate_values_as_candidate_key(n, seed=seed, rng=rng)
             else:
-                binning_indices = column.sample_binning_indices_in_independent_attribute_mode(n)
-                self.synthetic_dataset[attr] = column.sample_values_from_binning_indices(binning_indices)
+                binning_indices = column.sample_binning_indices_in_independent_attribute_mode(n, rng)
+                self.synthetic_dataset[attr] = column.sample_values_from_binning_indices(binning_indices, rng)
+
+    def generate_dataset_in_correlated_attribute_mode(self, n, description_file, seed=0, chunk_size=CHUNK_SIZE,
+                                                      num_workers=1):
+        encoded_chunks, synthetic_chunks = [], []
+        for encoded_chunk, synthetic_chunk in self.generate_chunks_in_correlated_attribute_mode(
+                n, description_file, seed, chunk_size, num_workers):
+            encoded_chunks.append(encoded_chunk)
+            synthetic_chunks.append(synthetic_chunk)
+        self.encoded_dataset = concat(encoded_chunks)
+        self.synthetic_dataset = concat(synthetic_chunks)
+
+    def generate_dataset_in_correlated_attribute_mode_to_file(self, n, description_file, to_file, seed=0,
+                                                              chunk_size=CHUNK_SIZE, num_workers=1, part_files=False):
+        """Stream the synthetic dataset to a CSV file, or a Parquet file if to_file ends with .parquet, one chunk of
+        chunk_size rows at a time. The rows are the ones of generate_dataset_in_correlated_attribute_mode with the
+        same seed and chunk_size, but only the chunks in progress are held in memory.
+
+        If part_files, the i-th chunk is written by its worker into its own file, e.g., synthetic-00000.csv for
+        to_file=synthetic.csv, and the paths of the part files are returned.
+        """
+        if not part_files:
+            chunks = self.generate_chunks_in_correlated_attribute_mode(n, description_file, seed, chunk_size,
+                                                                       num_workers)
+            DataGenerator.save_chunks((synthetic_chunk for _, synthetic_chunk in chunks), to_file)
+            return [Path(to_file)]
 
-    def generate_dataset_in_correlated_attribute_mode(self, n, description_file, seed=0):
-        set_random_seed(seed)
+        to_file = Path(to_file)
+        tasks = [(start, stop, chunk_seed, to_file.with_name(f'{to_file.stem}-{idx:05d}{to_file.suffix}'))
+                 for idx, (start, stop, chunk_seed) in enumerate(DataGenerator.split_into_chunks(n, seed, chunk_size))]
+        generator_state = self.prepare_correlated_attribute_mode(n, description_file, seed)
+        return list(DataGenerator.map_chunks(_write_chunk, tasks, generator_state, num_workers))
+
+    def generate_chunks_in_correlated_attribute_mode(self, n, description_file, seed=0, chunk_size=CHUNK_SIZE,
+                                                     num_workers=1):
+        """Generate the synthetic dataset in chunks of chunk_size rows.
+
+        Each chunk is sampled by its own np.random.Generator, seeded by a child of np.random.SeedSequence(seed), so the
+        rows of a chunk only depend on the seed and on the position of the chunk, whatever the number of workers.
+        Candidate keys are distinct over the n rows, so each chunk generates their values from its own offset in the n
+        rows, and draws what the values share (see generate_values_as_candidate_key) from the seed of the dataset.
+
+        Parameters
+        ----------
+        n : int
+            Number of rows of the synthetic dataset.
+        description_file : str
+            Dataset description in correlated attribute mode.
+        seed : int
+            Seed for the randomness in data generation.
+        chunk_size : int
+            Number of rows of each chunk.
+        num_workers : int
+            Number of processes generating chunks in parallel. The chunks are yielded in order.
+
+        Return
+        --------
+        generator
+            Generator of (encoded chunk, synthetic chunk), indexed by their row numbers in the synthetic dataset.
+        """
+        tasks = DataGenerator.split_into_chunks(n, seed, chunk_size)
+        generator_state = self.prepare_correlated_attribute_mode(n, description_file, seed)
+        return DataGenerator.map_chunks(_generate_chunk, tasks, generator_state, num_workers)
+
+    def prepare_correlated_attribute_mode(self, n, description_file, seed=0):
+        """Read the description and compute what the chunks of the synthetic dataset share, i.e., the compiled BN, the
+        attributes, the candidate keys, the number of rows and the seed. description_file is either a JSON description
+        or a directory written by DataGenerator.save_compiled_model.
+        """
         self.n = n
-        self.description = read_json_file(description_file)
+        if Path(description_file).is_dir():
+            self.description, compiled_bn = DataGenerator.load_compiled_model(description_file)
+        else:
+            self.description = read_json_file(description_file)
+            compiled_bn = DataGenerator.compile_bayesian_network(self.description)
 
         all_attributes = self.description['meta']['all_attributes']
         candidate_keys = set(self.description['meta']['candidate_keys'])
-        self.encoded_dataset = DataGenerator.generate_encoded_dataset(self.n, self.description)
-        self.synthetic_dataset = DataFrame(columns=all_attributes)
-        for attr in all_attributes:
-            attr_info = self.description['attribute_description'][attr]
-            column = parse_json(attr_info)
+        bn_attributes = {attr for attr, _, _ in compiled_bn}
+        attr_to_column = {attr: parse_json(self.description['attribute_description'][attr]) for attr in all_attributes}
+        return compiled_bn, attr_to_column, candidate_keys - bn_attributes, n, seed
 
-            if attr in self.encoded_dataset:
-                self.synthetic_dataset[attr] = column.sample_values_from_binning_indices(self.encoded_dataset[attr])
+    @staticmethod
+    def split_into_chunks(n, seed, chunk_size):
+        """List of (start, stop, seed sequence) of the chunks of n rows, with independent child seed sequences."""
+        chunk_seeds = random.SeedSequence(seed).spawn(-(-n // chunk_size))
+        return [(start, min(start + chunk_size, n), chunk_seed)
+                for start, chunk_seed in zip(range(0, n, chunk_size), chunk_seeds)]
+
+    @staticmethod
+    def map_chunks(function, tasks, generator_state, num_workers=1, max_in_flight=None):
+        """Apply function to the chunk tasks, in a pool of num_workers processes if num_workers > 1, in order.
+
+        At most max_in_flight tasks, 2 * num_workers by default, are submitted to the pool and not yet yielded, so that
+        the chunks do not pile up in memory when they are generated faster than they are consumed.
+        """
+        if num_workers > 1:
+            max_in_flight = 2 * num_workers if max_in_flight is None else max_in_flight
+            with Pool(num_workers, initializer=_init_worker, initargs=(generator_state,)) as pool:
+                pending = deque()
+                for task in tasks:
+                    if len(pending) >= max_in_flight:
+                        yield pending.popleft().get()
+                    pending.append(pool.apply_async(function, (task,)))
+                while pending:
+                    yield pending.popleft().get()
+        else:
+            _init_worker(generator_state)
+            yield from map(function, tasks)
+
+    @staticmethod
+    def generate_chunk(generator_state, start, stop, chunk_seed):
+        """Generate the rows from start to stop of the synthetic dataset, with a random generator seeded by chunk_seed."""
+        compiled_bn, attr_to_column, candidate_keys, n, seed = generator_state
+        rng = random.default_rng(chunk_seed)
+        index = range(start, stop)
+        encoded_chunk = DataGenerator.sample_encoded_dataset(len(index), compiled_bn, rng).set_axis(index)
+        synthetic_chunk = DataFrame(index=index)
+        for attr, column in attr_to_column.items():
+            if attr in encoded_chunk:
+                synthetic_chunk[attr] = column.sample_values_from_binning_indices(encoded_chunk[attr], rng)
             elif attr in candidate_keys:
-                self.synthetic_dataset[attr] = column.generate_values_as_candidate_key(n)
+                synthetic_chunk[attr] = column.generate_values_as_candidate_key(n, start, stop, seed, rng)
             else:
                 # for attributes not in BN or candidate keys, use independent attribute mode.
-                binning_indices = column.sample_binning_indices_in_independent_attribute_mode(n)
-                self.synthetic_dataset[attr] = column.sample_values_from_binning_indices(binning_indices)
+                binning_indices = column.sample_binning_indices_in_independent_attribute_mode(len(index), rng)
+                synthetic_chunk[attr] = column.sample_values_from_binning_indices(binning_indices.set_axis(index), rng)
+        return encoded_chunk, synthetic_chunk
 
     @staticmethod
     def get_sampling_order(bn):
@@ -85,40 +220,144 @@ class DataGenerator(object):
         return order
 
     @staticmethod
-    def generate_encoded_dataset(n, description):
+    def compile_bayesian_network(description):
+        """Compile the conditional distributions of the description for DataGenerator.sample_encoded_dataset.
+
+        Parameters
+        ----------
+        description : dict
+            Dataset description in correlated attribute mode.
+
+        Return
+        --------
+        list
+            List of (attribute, [parent,], compiled distributions) in sampling order. The parent values missing from
+            the conditional distributions of a child are sampled from unlisted_parents_distribution, as in
+            src.priv_bayes.PrivBayes.
+        """
         bn = description['bayesian_network']
         bn_root_attr = bn[0][1][0]
-        root_attr_dist = description['conditional_probabilities'][bn_root_attr]
-        encoded_df = DataFrame(columns=DataGenerator.get_sampling_order(bn))
-        encoded_df[bn_root_attr] = random.choice(len(root_attr_dist), size=n, p=root_attr_dist)
+        root_attr_dist = np.array(description['conditional_probabilities'][bn_root_attr])
+        compiled_bn = [(bn_root_attr, [], compile_distribution_table((), None, root_attr_dist[np.newaxis]))]
 
         for child, parents in bn:
             child_conditional_distributions = description['conditional_probabilities'][child]
-            for parents_instance in child_conditional_distributions.keys():
-                dist = child_conditional_distributions[parents_instance]
-                parents_instance = list(eval(parents_instance))
+            # the last bin of each parent is the bin of missing values
+            parents_shape = tuple(len(description['attribute_description'][parent]['distribution_bins']) + 1
+                                  for parent in parents)
+            child_cardinality = max(len(dist) for dist in child_conditional_distributions.values())
 
-                filter_condition = ''
-                for parent, value in zip(parents, parents_instance):
-                    filter_condition += f"(encoded_df['{parent}']=={value})&"
+            parents_instances = np.array([json.loads(parents_instance) for parents_instance in
+                                          child_conditional_distributions], dtype=np.int64).reshape(-1, len(parents))
+            rows = np.ravel_multi_index(tuple(parents_instances.T), parents_shape)
+            if domain_size(parents_shape) * child_cardinality <= MAX_DENSE_CELLS:
+                parents_keys = None
+                table = np.tile(unlisted_parents_distribution(child_cardinality), (domain_size(parents_shape), 1))
+            else:
+                # only the listed parent values have a row, followed by the row of the other parent values
+                order = np.argsort(rows)
+                parents_keys = rows[order]
+                table = np.zeros((rows.size + 1, child_cardinality))
+                table[-1] = unlisted_parents_distribution(child_cardinality)
+                rows = order.argsort()
+            for row, dist in zip(rows, child_conditional_distributions.values()):
+                table[row, :len(dist)] = dist
+            compiled_bn.append((child, parents, compile_distribution_table(parents_shape, parents_keys, table)))
+        return compiled_bn
 
-                filter_condition = eval(filter_condition[:-1])
+    @staticmethod
+    def save_compiled_model(description, directory):
+        """Save a description in correlated attribute mode with its compiled conditional distributions, in binary.
 
-                size = encoded_df[filter_condition].shape[0]
-                if size:
-                    encoded_df.loc[filter_condition, child] = random.choice(len(dist), size=size, p=dist)
+        The directory holds description.json, i.e., the description without its conditional distributions, and one
+        .npy file per array of compiled distributions, which DataGenerator.load_compiled_model memory-maps.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        compiled_description = {key: value for key, value in description.items() if key != 'conditional_probabilities'}
+        compiled_description['compiled_bayesian_network'] = []
+        for idx, (attr, parents, (parents_shape, parents_keys, cumulative)) in enumerate(
+                DataGenerator.compile_bayesian_network(description)):
+            np.save(directory / f'{idx}.cumulative.npy', cumulative)
+            if parents_keys is not None:
+                np.save(directory / f'{idx}.parents_keys.npy', parents_keys)
+            compiled_description['compiled_bayesian_network'].append({'attribute': attr,
+                                                                      'parents': parents,
+                                                                      'parents_shape': list(parents_shape),
+                                                                      'has_parents_keys': parents_keys is not None})
+        with open(directory / 'description.json', 'w') as outfile:
+            json.dump(compiled_description, outfile, indent=4)
 
-            unconditioned_distribution = description['attribute_description'][child]['distribution_probabilities']
-            encoded_df.loc[encoded_df[child].isnull(), child] = random.choice(len(unconditioned_distribution),
-                                                                              size=encoded_df[child].isnull().sum(),
-                                                                              p=unconditioned_distribution)
-        encoded_df[encoded_df.columns] = encoded_df[encoded_df.columns].astype(int)
+    @staticmethod
+    def load_compiled_model(directory, mmap_mode='r'):
+        """Load a directory written by DataGenerator.save_compiled_model.
+
+        Return
+        --------
+        tuple
+            (description, compiled BN), where the description has no conditional distributions and the compiled BN is
+            the output of DataGenerator.compile_bayesian_network, with memory-mapped arrays by default.
+        """
+        directory = Path(directory)
+        description = read_json_file(directory / 'description.json')
+        compiled_bn = []
+        for idx, node in enumerate(description.pop('compiled_bayesian_network')):
+            cumulative = np.load(directory / f'{idx}.cumulative.npy', mmap_mode=mmap_mode)
+            parents_keys = None
+            if node['has_parents_keys']:
+                parents_keys = np.load(directory / f'{idx}.parents_keys.npy', mmap_mode=mmap_mode)
+            compiled_distributions = (tuple(node['parents_shape']), parents_keys, cumulative)
+            compiled_bn.append((node['attribute'], node['parents'], compiled_distributions))
+        return description, compiled_bn
+
+    @staticmethod
+    def sample_encoded_dataset(n, compiled_bn, rng=None):
+        """Ancestral sampling of n rows of binning indices, one vectorized inverse-CDF draw per attribute.
+
+        The uniforms are drawn from rng, by default the global random state of numpy.
+        """
+        rng = random if rng is None else rng
+        encoded_df = DataFrame(index=range(n))
+        for attr, parents, compiled_distributions in compiled_bn:
+            parents_codes = [encoded_df[parent].to_numpy() for parent in parents]
+            encoded_df[attr] = sample_child(compiled_distributions, parents_codes, rng.random(n))
         return encoded_df
 
+    @staticmethod
+    def generate_encoded_dataset(n, description, rng=None):
+        return DataGenerator.sample_encoded_dataset(n, DataGenerator.compile_bayesian_network(description), rng)
+
     def save_synthetic_data(self, to_file):
         Path(to_file).touch()
         self.synthetic_dataset.to_csv(to_file, index=False)
 
+    @staticmethod
+    def save_chunks(chunks, to_file):
+        """Write the chunks of a dataset one after the other, into a Parquet file if to_file ends with .parquet, and
+        into a CSV file otherwise.
+        """
+        if Path(to_file).suffix == '.parquet':
+            try:
+                import pyarrow
+                from pyarrow import parquet
+            except ImportError:
+                raise Exception('Writing Parquet files requires pyarrow.')
+
+            writer = None
+            for chunk in chunks:
+                if writer is None:
+                    table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+                    writer = parquet.ParquetWriter(to_file, table.schema)
+                else:
+                    table = pyarrow.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+                writer.write_table(table)
+            if writer is not None:
+                writer.close()
+        else:
+            Path(to_file).touch()
+            for idx, chunk in enumerate(chunks):
+                chunk.to_csv(to_file, index=False, mode='a' if idx else 'w', header=not idx)
+
 
 if __name__ == '__main__':
     from time import time
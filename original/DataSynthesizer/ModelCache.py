@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+"""
+On-disk cache of dataset descriptions, so that describing an unchanged dataset with unchanged parameters is a file load.
+"""
+
+
+def hash_file(file_name, block_size=1 << 20):
+    """SHA-256 of the content of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelCache:
+    """Directory of dataset descriptions in JSON, keyed by the content of the input dataset and all parameters.
+
+    The least recently used descriptions are evicted once the total size of the directory exceeds max_size. The last
+    access time of an entry is recorded in the modification time of its file.
+
+    Attributes
+    ----------
+    directory : Path
+        Directory of the cache, created if it does not exist.
+    max_size : int
+        Maximum total size of the cached descriptions, in bytes.
+    """
+
+    def __init__(self, directory, max_size=1 << 30):
+        self.directory = Path(directory).expanduser()
+        self.max_size: int = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(dataset_file, parameters):
+        """Key of a dataset file described with the given parameters.
+
+        Parameters
+        ----------
+        dataset_file : str
+            File name of the input dataset, whose content is hashed, so that a modified file is described again.
+        parameters : dict
+            All parameters of the description, serializable in JSON, possibly after conversion to strings.
+        """
+        digest = hashlib.sha256(hash_file(dataset_file).encode())
+        digest.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.directory / f'{key}.json'
+
+    def load(self, key):
+        """Cached description of a key, or None if it is not cached."""
+        path = self.path(key)
+        try:
+            with open(path) as file:
+                description = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(path)
+        return description
+
+    def save(self, key, description):
+        """Cache a description, then evict the least recently used descriptions beyond max_size."""
+        # write to a temporary file first, so that concurrent jobs never load a partial description
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, suffix='.tmp', delete=False) as file:
+            json.dump(description, file)
+        os.replace(file.name, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        for path in self.directory.glob('*.json'):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
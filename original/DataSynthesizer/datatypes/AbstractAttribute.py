@@ -1,27 +1,34 @@
 from abc import ABCMeta, abstractmethod
-from bisect import bisect_right
 from random import uniform
 from typing import List, Union
 
 import numpy as np
-from numpy.random import choice
-from pandas import Series
+from pandas import Categorical, Series
 
 from original.DataSynthesizer.datatypes.utils import DataType
+from original.DataSynthesizer.datatypes.utils.ColumnStatistics import ColumnStatistics
 from DataSynthesizer.lib import utils
 
 
 class AbstractAttribute(object):
     __metaclass__ = ABCMeta
 
-    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series):
+    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series,
+                 counts: np.ndarray = None):
         self.name = name
         self.is_candidate_key = is_candidate_key
         self.is_categorical = is_categorical
         self.histogram_size: Union[int, str] = histogram_size
         self.data: Series = data
         self.data_dropna: Series = self.data.dropna()
-        self.missing_rate: float = (self.data.size - self.data_dropna.size) / (self.data.size or 1)
+        # when the dataset is read in chunks, data only holds the distinct values, which are counted in counts
+        self.counts: np.ndarray = counts
+        self.counts_dropna: np.ndarray = None if counts is None else counts[self.data.notna().to_numpy()]
+        self.num_tuples: int = self.data.size if counts is None else int(counts.sum())
+        num_values = self.data_dropna.size if counts is None else int(self.counts_dropna.sum())
+        self.missing_rate: float = (self.num_tuples - num_values) / (self.num_tuples or 1)
+        # ColumnStatistics of the input column, which spare infer_domain another pass over the values if given
+        self.statistics: ColumnStatistics = None
 
         self.is_numerical: bool = None
         self.data_type: DataType = None
@@ -43,8 +50,12 @@ class AbstractAttribute(object):
             self.min, self.max = numerical_range
             self.distribution_bins = np.array([self.min, self.max])
         else:
-            self.min = float(self.data_dropna.min())
-            self.max = float(self.data_dropna.max())
+            if self.statistics is not None and self.statistics.min is not None:
+                self.min = float(self.statistics.min)
+                self.max = float(self.statistics.max)
+            else:
+                self.min = float(self.data_dropna.min())
+                self.max = float(self.data_dropna.max())
             if self.is_categorical:
                 self.distribution_bins = self.data_dropna.unique()
             else:
@@ -55,20 +66,27 @@ class AbstractAttribute(object):
     @abstractmethod
     def infer_distribution(self):
         if self.is_categorical:
-            distribution = self.data_dropna.value_counts()
+            distribution = self.value_counts(self.data_dropna)
             for value in set(self.distribution_bins) - set(distribution.index):
                 distribution[value] = 0
             distribution.sort_index(inplace=True)
             self.distribution_probabilities = utils.normalize_given_distribution(distribution)
             self.distribution_bins = np.array(distribution.index)
         else:
-            distribution = np.histogram(self.data_dropna, bins=self.histogram_size, range=(self.min, self.max))
+            distribution = np.histogram(self.data_dropna, bins=self.histogram_size, range=(self.min, self.max),
+                                        weights=self.counts_dropna)
             self.distribution_bins = distribution[1][:-1]  # Remove the last bin edge
             self.distribution_probabilities = utils.normalize_given_distribution(distribution[0])
 
+    def value_counts(self, values_dropna: Series):
+        """Number of occurrences of each value of a Series aligned with self.data_dropna, e.g., self.data_dropna."""
+        if self.counts_dropna is None:
+            return values_dropna.value_counts()
+        return Series(self.counts_dropna).groupby(values_dropna.to_numpy()).sum()
+
     def inject_laplace_noise(self, epsilon, num_valid_attributes):
         if epsilon > 0:
-            sensitivity = 2 / self.data.size
+            sensitivity = 2 / self.num_tuples
             privacy_budget = epsilon / num_valid_attributes
             noise_scale = sensitivity / privacy_budget
             laplace_noises = np.random.laplace(0, scale=noise_scale, size=len(self.distribution_probabilities))
@@ -80,13 +98,40 @@ class AbstractAttribute(object):
 
         """
         if self.is_categorical:
-            value_to_bin_idx = {value: idx for idx, value in enumerate(self.distribution_bins)}
-            encoded = self.data.map(lambda x: value_to_bin_idx[x], na_action='ignore')
-        else:
-            encoded = self.data.map(lambda x: bisect_right(self.distribution_bins, x) - 1, na_action='ignore')
+            return self.place_bin_indices(self.encode_categorical_values(self.data_dropna))
+        return self.place_bin_indices(np.searchsorted(self.distribution_bins, self.data_dropna, side='right') - 1)
 
-        encoded.fillna(len(self.distribution_bins), inplace=True)
-        return encoded.astype(int, copy=False)
+    def encode_values(self, values: Series):
+        """Encode other values of the attribute into bin indices, e.g., a chunk of a dataset read in chunks."""
+        values_dropna = self.prepare_values(values.dropna())
+        if self.is_categorical:
+            bin_indices = self.encode_categorical_values(values_dropna)
+        else:
+            bin_indices = np.searchsorted(self.distribution_bins, values_dropna, side='right') - 1
+        return self.place_bin_indices(bin_indices, values)
+
+    def prepare_values(self, values_dropna: Series):
+        """Convert non-missing values into the values compared with self.distribution_bins."""
+        return values_dropna
+
+    def encode_categorical_values(self, values: Series):
+        """Indices of the values in self.distribution_bins."""
+        codes = Categorical(values, categories=self.distribution_bins).codes
+        if (codes < 0).any():
+            raise Exception(f'Some values of {self.name} are not in its categorical domain.')
+        return codes
+
+    def place_bin_indices(self, bin_indices: np.ndarray, values: Series = None):
+        """Convert the bin indices of the non-missing values into a Series aligned with the values, self.data by
+        default, where missing values are in the last bin, len(self.distribution_bins). The dtype is the smallest
+        integer type holding all indices.
+        """
+        values = self.data if values is None else values
+        num_bins = len(self.distribution_bins)
+        dtype = np.result_type(np.min_scalar_type(num_bins), np.min_scalar_type(bin_indices.min(initial=0)))
+        encoded = np.full(values.size, num_bins, dtype=dtype)
+        encoded[values.notna().to_numpy()] = bin_indices
+        return Series(encoded, index=values.index, name=values.name)
 
     def to_json(self):
         """Encode attribution information in JSON format / Python dictionary.
@@ -103,24 +148,50 @@ class AbstractAttribute(object):
                 "distribution_probabilities": self.distribution_probabilities.tolist()}
 
     @abstractmethod
-    def generate_values_as_candidate_key(self, n):
+    def generate_values_as_candidate_key(self, n, start=0, stop=None, seed=None, rng=None):
         """When attribute should be a candidate key in output dataset.
 
+        Return the values from start to stop of n distinct values, so that the values of a chunk of rows can be
+        generated without the others. What the n values share, e.g., the order of SocialSecurityNumber keys or the
+        length of String keys, is drawn from seed, which is the same for all chunks of a dataset, and the rest, e.g.,
+        the letters of String keys, from rng, the random generator of the chunk.
         """
-        return np.arange(n)
+        return np.arange(start, n if stop is None else stop)
 
-    def sample_binning_indices_in_independent_attribute_mode(self, n):
+    def sample_binning_indices_in_independent_attribute_mode(self, n, rng=None):
         """Sample an array of binning indices.
 
         """
-        return Series(choice(len(self.distribution_probabilities), size=n, p=self.distribution_probabilities))
+        rng = np.random if rng is None else rng
+        return Series(rng.choice(len(self.distribution_probabilities), size=n, p=self.distribution_probabilities))
 
     @abstractmethod
-    def sample_values_from_binning_indices(self, binning_indices):
+    def sample_values_from_binning_indices(self, binning_indices, rng=None):
         """Convert binning indices into values in domain. Used by both independent and correlated attribute mode.
 
+        All values are sampled at once, as uniform_sampling_within_a_bin does for a single value.
+
+        Parameters
+        ----------
+        binning_indices : Series
+            Binning indices, where len(self.distribution_bins) is the bin of missing values.
+        rng : np.random.Generator, optional
+            Random generator. By default, the global random state of numpy, which is seeded by set_random_seed.
         """
-        return binning_indices.apply(lambda x: self.uniform_sampling_within_a_bin(x))
+        rng = np.random if rng is None else rng
+        bin_indices = np.asarray(binning_indices, dtype=np.int64)
+        index = binning_indices.index if isinstance(binning_indices, Series) else None
+        num_bins = len(self.distribution_bins)
+        if self.is_categorical:
+            domain = np.append(np.asarray(self.distribution_bins, dtype=object), np.nan)
+            return Series(domain[bin_indices], index=index).infer_objects()
+
+        # the right edge of the last bin is self.max
+        edges = np.append(np.asarray(self.distribution_bins, dtype=float), self.max)
+        left_indices = np.minimum(bin_indices, num_bins - 1)
+        values = rng.uniform(edges[left_indices], edges[left_indices + 1])
+        values[bin_indices == num_bins] = np.nan
+        return Series(values, index=index)
 
     def uniform_sampling_within_a_bin(self, bin_idx: int):
         num_bins = len(self.distribution_bins)
@@ -1,25 +1,27 @@
-from bisect import bisect_right
+import warnings
 from typing import Union
 
 import numpy as np
 from dateutil.parser import parse
-from pandas import Series, concat
+from pandas import Series, to_datetime
+from pandas.tseries.api import guess_datetime_format
 
 from original.DataSynthesizer.datatypes import AbstractAttribute
 from original.DataSynthesizer.datatypes.utils.DataType import DataType
 from DataSynthesizer.lib.utils import normalize_given_distribution
 
 
+WEEKDAYS = {'mon', 'monday', 'tue', 'tuesday', 'wed', 'wednesday', 'thu', 'thursday', 'fri', 'friday',
+            'sat', 'saturday', 'sun', 'sunday'}
+MONTHS = {'jan', 'january', 'feb', 'february', 'mar', 'march', 'apr', 'april', 'may', 'may', 'jun', 'june',
+          'jul', 'july', 'aug', 'august', 'sep', 'sept', 'september', 'oct', 'october', 'nov', 'november',
+          'dec', 'december'}
+
+
 def is_datetime(value: str):
     """Find whether a value is a datetime. Here weekdays and months are categorical values instead of datetime."""
-    weekdays = {'mon', 'monday', 'tue', 'tuesday', 'wed', 'wednesday', 'thu', 'thursday', 'fri', 'friday',
-                'sat', 'saturday', 'sun', 'sunday'}
-    months = {'jan', 'january', 'feb', 'february', 'mar', 'march', 'apr', 'april', 'may', 'may', 'jun', 'june',
-              'jul', 'july', 'aug', 'august', 'sep', 'sept', 'september', 'oct', 'october', 'nov', 'november',
-              'dec', 'december'}
-
     value_lower = value.lower()
-    if (value_lower in weekdays) or (value_lower in months):
+    if (value_lower in WEEKDAYS) or (value_lower in MONTHS):
         return False
     try:
         parse(value)
@@ -28,14 +30,83 @@ def is_datetime(value: str):
         return False
 
 
-# TODO detect datetime formats
+def are_datetimes(values: Series):
+    """Vectorized is_datetime, which parses the values in their most common format at once, and only parses the other
+    values one by one.
+    """
+    values = values.astype(str)
+    is_weekday_or_month = values.str.lower().isin(WEEKDAYS | MONTHS)
+    datetime_format = infer_datetime_format(values)
+    if datetime_format is None:
+        parsed = Series(False, index=values.index)
+    else:
+        parsed = to_datetime(values, format=datetime_format, errors='coerce', utc=True).notnull()
+    parsed[~parsed] = values[~parsed].map(is_datetime)
+    return parsed & ~is_weekday_or_month
+
+
+def guess_datetime_formats(values: Series):
+    """Datetime format guessed for each value, None if no format is found.
+
+    pandas warns when it guesses a day-first format, which dateutil only applies if the day cannot be a month. The
+    warning is silenced, as the day-first values are parsed as dateutil does (see parse_timestamps).
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return values.map(lambda x: guess_datetime_format(str(x)))
+
+
+def infer_datetime_format(values: Series, sample_size=100):
+    """Most common datetime format among a sample of values, or None if no format is found."""
+    formats = guess_datetime_formats(values.head(sample_size)).dropna()
+    if formats.empty:
+        return None
+    return formats.value_counts().index[0]
+
+
+def parse_timestamps(values: Series, sample_size=100):
+    """Convert datetime strings into seconds since 1970-01-01, as int((parse(x) - epoch).total_seconds()) does.
+
+    If the values of a sample all have the same format, it converts all values at once, and only the values in another
+    format are parsed one by one by dateutil. Otherwise, or if the conversion of the sample differs from dateutil, all
+    values are parsed one by one. With a day-first format, the values whose day may be a month are parsed one by one
+    too, as dateutil reads them month first.
+    """
+    epoch_datetime = parse('1970-01-01')
+
+    def parse_timestamp(value):
+        return int((parse(value) - epoch_datetime).total_seconds())
+
+    sample = values.head(sample_size)
+    formats = guess_datetime_formats(sample).dropna().unique()
+    if len(formats) != 1 or '%z' in formats[0] or '%Z' in formats[0]:
+        # timezone-aware datetimes cannot be compared with the epoch, as in the per-value parsing
+        return values.map(parse_timestamp).astype(np.int64)
+    datetime_format = formats[0]
+    datetimes = to_datetime(values, format=datetime_format, errors='coerce')
+
+    # total_seconds() is truncated towards zero by int(), which is done on nanoseconds as floats lose the fractions
+    nanoseconds = (datetimes - epoch_datetime).to_numpy().astype('timedelta64[ns]').astype(np.int64)
+    failed = datetimes.isnull()
+    if '%d' in datetime_format and '%m' in datetime_format and \
+            datetime_format.index('%d') < datetime_format.index('%m'):
+        failed |= datetimes.dt.day <= 12
+    nanoseconds = np.where(failed, 0, nanoseconds)
+    timestamps = Series(np.sign(nanoseconds) * (np.abs(nanoseconds) // 10 ** 9), index=values.index)
+    if failed.any():
+        timestamps[failed] = values[failed].map(parse_timestamp)
+    if not timestamps.iloc[:sample.size].equals(sample.map(parse_timestamp).astype(np.int64)):
+        return values.map(parse_timestamp).astype(np.int64)
+    return timestamps
+
+
 class DateTimeAttribute(AbstractAttribute):
-    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series):
-        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data)
+    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series,
+                 counts=None):
+        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data, counts)
         self.is_numerical = True
         self.data_type = DataType.DATETIME
-        epoch_datetime = parse('1970-01-01')
-        self.timestamps = self.data_dropna.map(lambda x: int((parse(x) - epoch_datetime).total_seconds()))
+        self.timestamps = parse_timestamps(self.data_dropna)
 
     def infer_domain(self, categorical_domain=None, numerical_range=None):
         if numerical_range:
@@ -53,14 +124,15 @@ class DateTimeAttribute(AbstractAttribute):
 
     def infer_distribution(self):
         if self.is_categorical:
-            distribution = self.data_dropna.value_counts()
+            distribution = self.value_counts(self.data_dropna)
             for value in set(self.distribution_bins) - set(distribution.index):
                 distribution[value] = 0
             distribution.sort_index(inplace=True)
             self.distribution_probabilities = normalize_given_distribution(distribution)
             self.distribution_bins = np.array(distribution.index)
         else:
-            distribution = np.histogram(self.timestamps, bins=self.histogram_size, range=(self.min, self.max))
+            distribution = np.histogram(self.timestamps, bins=self.histogram_size, range=(self.min, self.max),
+                                        weights=self.counts_dropna)
             self.distribution_probabilities = normalize_given_distribution(distribution[0])
 
     def encode_values_into_bin_idx(self):
@@ -68,20 +140,17 @@ class DateTimeAttribute(AbstractAttribute):
 
         """
         if self.is_categorical:
-            value_to_bin_idx = {value: idx for idx, value in enumerate(self.distribution_bins)}
-            encoded = self.data.map(lambda x: value_to_bin_idx[x], na_action='ignore')
-        else:
-            encoded = self.timestamps.map(lambda x: bisect_right(self.distribution_bins, x) - 1, na_action='ignore')
-            encoded = concat([encoded, self.data], axis=1).iloc[:, 0]
+            return self.place_bin_indices(self.encode_categorical_values(self.data_dropna))
+        return self.place_bin_indices(np.searchsorted(self.distribution_bins, self.timestamps, side='right') - 1)
 
-        encoded.fillna(len(self.distribution_bins), inplace=True)
-        return encoded.astype(int, copy=False)
+    def prepare_values(self, values_dropna):
+        return values_dropna if self.is_categorical else parse_timestamps(values_dropna)
 
-    def generate_values_as_candidate_key(self, n):
-        return np.arange(self.min, self.max, (self.min - self.max) / n)
+    def generate_values_as_candidate_key(self, n, start=0, stop=None, seed=None, rng=None):
+        return self.min + np.arange(start, n if stop is None else stop) * ((self.max - self.min) / n)
 
-    def sample_values_from_binning_indices(self, binning_indices):
-        column = super().sample_values_from_binning_indices(binning_indices)
+    def sample_values_from_binning_indices(self, binning_indices, rng=None):
+        column = super().sample_values_from_binning_indices(binning_indices, rng)
         if not self.is_categorical:
             column[~column.isnull()] = column[~column.isnull()].astype(int)
         return column
@@ -8,8 +8,9 @@ from original.DataSynthesizer.datatypes.utils.DataType import DataType
 
 
 class FloatAttribute(AbstractAttribute):
-    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series):
-        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data)
+    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series,
+                 counts=None):
+        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data, counts)
         self.is_numerical = True
         self.data_type = DataType.FLOAT
 
@@ -19,8 +20,8 @@ class FloatAttribute(AbstractAttribute):
     def infer_distribution(self):
         super().infer_distribution()
 
-    def generate_values_as_candidate_key(self, n):
-        return arange(self.min, self.max, (self.max - self.min) / n)
+    def generate_values_as_candidate_key(self, n, start=0, stop=None, seed=None, rng=None):
+        return self.min + arange(start, n if stop is None else stop) * ((self.max - self.min) / n)
 
-    def sample_values_from_binning_indices(self, binning_indices):
-        return super().sample_values_from_binning_indices(binning_indices)
+    def sample_values_from_binning_indices(self, binning_indices, rng=None):
+        return super().sample_values_from_binning_indices(binning_indices, rng)
@@ -7,8 +7,9 @@ from original.DataSynthesizer.datatypes.utils.DataType import DataType
 
 
 class IntegerAttribute(AbstractAttribute):
-    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series):
-        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data)
+    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series,
+                 counts=None):
+        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data, counts)
         self.is_numerical = True
         self.data_type = DataType.INTEGER
 
@@ -20,11 +21,11 @@ class IntegerAttribute(AbstractAttribute):
     def infer_distribution(self):
         super().infer_distribution()
 
-    def generate_values_as_candidate_key(self, n):
-        return super().generate_values_as_candidate_key(n)
+    def generate_values_as_candidate_key(self, n, start=0, stop=None, seed=None, rng=None):
+        return super().generate_values_as_candidate_key(n, start, stop, seed, rng)
 
-    def sample_values_from_binning_indices(self, binning_indices):
-        column = super().sample_values_from_binning_indices(binning_indices)
+    def sample_values_from_binning_indices(self, binning_indices, rng=None):
+        column = super().sample_values_from_binning_indices(binning_indices, rng)
         column = column.round()
         column[~column.isnull()] = column[~column.isnull()].astype(int)
         return column
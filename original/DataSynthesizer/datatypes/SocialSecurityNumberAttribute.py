@@ -1,7 +1,9 @@
+from math import gcd
 from typing import Union
 
 import numpy as np
-from pandas import Series
+from pandas import Series, to_numeric
+from pandas.api.types import is_integer_dtype
 
 from original.DataSynthesizer.datatypes import AbstractAttribute
 from original.DataSynthesizer.datatypes.utils.DataType import DataType
@@ -34,11 +36,22 @@ def is_ssn(value):
     return False
 
 
+def are_ssns(values: Series):
+    """Vectorized is_ssn."""
+    if is_integer_dtype(values):
+        return (values > 0) & (values < 1e9)
+    digits = values.astype(str).str.replace('-', '', regex=False)
+    is_digit = digits.str.fullmatch(r'\d+')
+    numbers = to_numeric(digits.where(is_digit), errors='coerce')
+    return is_digit & (numbers > 0) & (numbers < 1e9)
+
+
 class SocialSecurityNumberAttribute(AbstractAttribute):
     """SocialSecurityNumber of format AAA-GG-SSSS."""
 
-    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series):
-        super().__init__(name, is_candidate_key, is_categorical, histogram_size, pre_process(data))
+    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series,
+                 counts=None):
+        super().__init__(name, is_candidate_key, is_categorical, histogram_size, pre_process(data), counts)
         self.is_numerical = True
         self.data_type = DataType.SOCIAL_SECURITY_NUMBER
 
@@ -50,14 +63,30 @@ class SocialSecurityNumberAttribute(AbstractAttribute):
     def infer_distribution(self):
         super().infer_distribution()
 
-    def generate_values_as_candidate_key(self, n):
+    def prepare_values(self, values_dropna):
+        return pre_process(values_dropna)
+
+    def generate_values_as_candidate_key(self, n, start=0, stop=None, seed=None, rng=None):
         if n < 1e9:
-            values = np.linspace(0, 1e9 - 1, num=n, dtype=int)
-            values = np.random.permutation(values)
+            # the rows are mapped to the values of np.linspace(0, 1e9 - 1, num=n, dtype=int) by a random affine
+            # bijection of the row numbers modulo n, so that each chunk shuffles its values over the whole range
+            rng = np.random.default_rng(seed)
+            num_values = max(n, 1)
+            multiplier = int(rng.integers(1, num_values + 1))
+            while gcd(multiplier, num_values) != 1:
+                multiplier = int(rng.integers(1, num_values + 1))
+            offset = int(rng.integers(num_values))
+            positions = (np.arange(start, n if stop is None else stop) * multiplier + offset) % num_values
+            values = (positions * ((1e9 - 1) / max(n - 1, 1))).astype(int)
             values = [str(i).zfill(9) for i in values]
             return ['{}-{}-{}'.format(i[:3], i[3:5], i[5:]) for i in values]
         else:
             raise Exception('The candidate key "{}" cannot generate more than 1e9 distinct values.', self.name)
 
-    def sample_values_from_binning_indices(self, binning_indices):
-        return super().sample_binning_indices_in_independent_attribute_mode(binning_indices)
+    def sample_values_from_binning_indices(self, binning_indices, rng=None):
+        column = super().sample_values_from_binning_indices(binning_indices, rng).round()
+        not_null = ~column.isnull()
+        values = column[not_null].astype(np.int64).astype(str).str.zfill(9)
+        column = column.astype(object)
+        column[not_null] = values.str[:3] + '-' + values.str[3:5] + '-' + values.str[5:]
+        return column
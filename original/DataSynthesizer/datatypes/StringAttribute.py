@@ -1,3 +1,4 @@
+from string import ascii_lowercase
 from typing import Union
 
 import numpy as np
@@ -8,13 +9,27 @@ from original.DataSynthesizer.datatypes.utils.DataType import DataType
 from DataSynthesizer.lib import utils
 
 
+def generate_random_strings(lengths, rng=None):
+    """Vectorized utils.generate_random_string, returning an array of random lowercase strings of the given lengths."""
+    rng = np.random if rng is None else rng
+    lengths = np.maximum(lengths, 0)
+    max_length = int(lengths.max(initial=0))
+    if not max_length:
+        return np.full(lengths.size, '', dtype=object)
+    letters = rng.choice(np.frombuffer(ascii_lowercase.encode(), dtype=np.uint8), size=(lengths.size, max_length))
+    # null bytes at the end of fixed-width bytes are dropped, which cuts each string to its length
+    letters[np.arange(max_length) >= lengths[:, np.newaxis]] = 0
+    return letters.view(f'S{max_length}').ravel().astype(str).astype(object)
+
+
 class StringAttribute(AbstractAttribute):
     """Variable min and max are the lengths of the shortest and longest strings.
 
     """
 
-    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series):
-        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data)
+    def __init__(self, name: str, is_candidate_key, is_categorical, histogram_size: Union[int, str], data: Series,
+                 counts=None):
+        super().__init__(name, is_candidate_key, is_categorical, histogram_size, data, counts)
         self.is_numerical = False
         self.data_type = DataType.STRING
         self.data_dropna = self.data_dropna.astype(str)
@@ -27,8 +42,12 @@ class StringAttribute(AbstractAttribute):
             self.max = max(lengths)
             self.distribution_bins = np.array(categorical_domain)
         else:
-            self.min = int(self.data_dropna_len.min())
-            self.max = int(self.data_dropna_len.max())
+            if self.statistics is not None and self.statistics.min_length is not None:
+                self.min = self.statistics.min_length
+                self.max = self.statistics.max_length
+            else:
+                self.min = int(self.data_dropna_len.min())
+                self.max = int(self.data_dropna_len.max())
             if self.is_categorical:
                 self.distribution_bins = self.data_dropna.unique()
             else:
@@ -38,25 +57,39 @@ class StringAttribute(AbstractAttribute):
 
     def infer_distribution(self):
         if self.is_categorical:
-            distribution = self.data_dropna.value_counts()
+            distribution = self.value_counts(self.data_dropna)
             for value in set(self.distribution_bins) - set(distribution.index):
                 distribution[value] = 0
             distribution.sort_index(inplace=True)
             self.distribution_probabilities = utils.normalize_given_distribution(distribution)
             self.distribution_bins = np.array(distribution.index)
         else:
-            distribution = np.histogram(self.data_dropna_len, bins=self.histogram_size)
+            distribution = np.histogram(self.data_dropna_len, bins=self.histogram_size, weights=self.counts_dropna)
             self.distribution_bins = distribution[1][:-1]
             self.distribution_probabilities = utils.normalize_given_distribution(distribution[0])
 
-    def generate_values_as_candidate_key(self, n):
-        length = np.random.randint(self.min, self.max + 1)
-        vectorized = np.vectorize(lambda x: '{}{}'.format(utils.generate_random_string(length), x))
-        return vectorized(np.arange(n))
+    def encode_values_into_bin_idx(self):
+        """Encode values into bin indices for Bayesian Network construction, i.e., the bins of their lengths if the
+        attribute is not categorical.
+        """
+        if self.is_categorical:
+            return self.place_bin_indices(self.encode_categorical_values(self.data_dropna))
+        return self.place_bin_indices(np.searchsorted(self.distribution_bins, self.data_dropna_len, side='right') - 1)
+
+    def prepare_values(self, values_dropna):
+        values_dropna = values_dropna.astype(str)
+        return values_dropna if self.is_categorical else values_dropna.map(len)
+
+    def generate_values_as_candidate_key(self, n, start=0, stop=None, seed=None, rng=None):
+        length = np.random.default_rng(seed).integers(self.min, self.max + 1)
+        row_numbers = np.arange(start, n if stop is None else stop)
+        return generate_random_strings(np.full(row_numbers.size, length), rng) + row_numbers.astype(str).astype(object)
 
-    def sample_values_from_binning_indices(self, binning_indices):
-        column = super().sample_values_from_binning_indices(binning_indices)
+    def sample_values_from_binning_indices(self, binning_indices, rng=None):
+        column = super().sample_values_from_binning_indices(binning_indices, rng)
         if not self.is_categorical:
-            column[~column.isnull()] = column[~column.isnull()].apply(lambda x: utils.generate_random_string(int(x)))
+            not_null = ~column.isnull()
+            column = column.astype(object)
+            column[not_null] = generate_random_strings(column[not_null].astype(int).to_numpy(), rng)
 
         return column
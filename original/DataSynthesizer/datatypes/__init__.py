@@ -0,0 +1,3 @@
+from original.DataSynthesizer.datatypes.AbstractAttribute import AbstractAttribute
+from original.DataSynthesizer.datatypes.DateTimeAttribute import DateTimeAttribute, are_datetimes, is_datetime
+from original.DataSynthesizer.datatypes.utils.AttributeLoader import parse_json
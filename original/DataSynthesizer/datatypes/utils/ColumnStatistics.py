@@ -0,0 +1,101 @@
+import numpy as np
+from pandas import Series, unique
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from pandas.util import hash_pandas_object
+
+
+def estimate_distinct_count(hashes: np.ndarray, precision=14):
+    """HyperLogLog estimate of the number of distinct values of an array of 64-bit hashes."""
+    num_registers = 1 << precision
+    register_indices = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    # the lowest bits are set so that the rank of the remaining bits is at most 64 - precision + 1
+    remaining_bits = (hashes << np.uint64(precision)) | np.uint64(num_registers - 1)
+    ranks = 65 - np.frexp(remaining_bits.astype(float))[1]
+    registers = np.zeros(num_registers, dtype=np.int64)
+    np.maximum.at(registers, register_indices, ranks)
+
+    alpha = 0.7213 / (1 + 1.079 / num_registers)
+    estimate = alpha * num_registers ** 2 / np.exp2(-registers.astype(float)).sum()
+    num_empty_registers = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * num_registers and num_empty_registers:
+        # linear counting for small cardinalities
+        estimate = num_registers * np.log(num_registers / num_empty_registers)
+    return estimate
+
+
+class ColumnStatistics:
+    """Statistics of a column computed in a single pass, shared by the detection of candidate keys and categorical
+    attributes, and by AbstractAttribute.infer_domain.
+
+    Attributes
+    ----------
+    num_tuples : int
+        Number of values, including missing values.
+    num_missing : int
+        Number of missing values.
+    num_distinct : int
+        Number of distinct non-missing values, which is a HyperLogLog estimate if is_distinct_exact is False.
+    is_distinct_exact : bool
+    is_unique : bool
+        Whether all values are distinct, as Series.is_unique, where missing values are equal.
+    min, max
+        Minimum and maximum of the non-missing values if they are numerical, otherwise None.
+    min_length, max_length : int
+        Minimum and maximum of the lengths of the non-missing values if they are not numerical, otherwise None.
+    """
+
+    def __init__(self, num_tuples, num_missing, num_distinct, is_distinct_exact, is_unique, min=None, max=None,
+                 min_length=None, max_length=None):
+        self.num_tuples: int = num_tuples
+        self.num_missing: int = num_missing
+        self.num_distinct: int = num_distinct
+        self.is_distinct_exact: bool = is_distinct_exact
+        self.is_unique: bool = is_unique
+        self.min = min
+        self.max = max
+        self.min_length: int = min_length
+        self.max_length: int = max_length
+
+    @staticmethod
+    def from_column(column: Series, max_exact_distinct=1000000):
+        """Statistics of a column, whose distinct values are estimated by HyperLogLog above max_exact_distinct values.
+
+        The distinct values are only counted exactly beyond max_exact_distinct to decide whether the column is unique,
+        when the estimate is close to the number of values.
+        """
+        values = column.dropna()
+        num_missing = column.size - values.size
+        hashes = hash_pandas_object(values, index=False).to_numpy()
+        if values.size > max_exact_distinct:
+            num_distinct = int(round(estimate_distinct_count(hashes)))
+            is_distinct_exact = False
+            # the relative error of the estimate is about 1%
+            is_unique = num_distinct > 0.95 * values.size and unique(hashes).size == values.size
+        else:
+            num_distinct = unique(hashes).size
+            is_distinct_exact = True
+            is_unique = num_distinct == values.size
+        return ColumnStatistics.from_values(values, column.size, num_missing, num_distinct, is_distinct_exact,
+                                            is_unique and num_missing <= 1)
+
+    @staticmethod
+    def from_value_counts(value_counts: Series):
+        """Statistics of a column from the number of occurrences of its distinct values, including missing values."""
+        not_null = value_counts.index.notna()
+        values = Series(value_counts.index[not_null])
+        num_tuples = int(value_counts.sum())
+        num_missing = int(value_counts[~not_null].sum())
+        return ColumnStatistics.from_values(values.infer_objects(), num_tuples, num_missing, values.size, True,
+                                            bool((value_counts <= 1).all()))
+
+    @staticmethod
+    def from_values(values: Series, num_tuples, num_missing, num_distinct, is_distinct_exact, is_unique):
+        statistics = ColumnStatistics(num_tuples, num_missing, num_distinct, is_distinct_exact, is_unique)
+        if not values.size:
+            return statistics
+        if is_numeric_dtype(values) and not is_bool_dtype(values):
+            statistics.min, statistics.max = values.min(), values.max()
+        else:
+            lengths = values.astype(str).str.len()
+            statistics.min_length, statistics.max_length = int(lengths.min()), int(lengths.max())
+        return statistics
@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from original.DataSynthesizer.DataDescriber import DataDescriber
+from original.DataSynthesizer.ModelCache import ModelCache
+from original.DataSynthesizer.datatypes.utils.ColumnStatistics import ColumnStatistics, estimate_distinct_count
+
+input_data = Path(__file__).parent / 'data' / 'adult_tiny.csv'
+
+
+def describe(dataset_file, **parameters):
+    describer = DataDescriber(category_threshold=20, **parameters)
+    describer.describe_dataset_in_correlated_attribute_mode(dataset_file=dataset_file, epsilon=1, k=2, seed=0)
+    describer.record_conditional_distributions_in_description()
+    return describer.data_description
+
+
+def test_chunked_description():
+    assert describe(input_data, chunksize=300) == describe(input_data)
+
+
+def test_chunked_parquet_description(tmp_path):
+    pytest.importorskip('pyarrow')
+    pd.read_csv(input_data, skipinitialspace=True).to_parquet(tmp_path / 'input.parquet')
+    assert describe(tmp_path / 'input.parquet', chunksize=300) == describe(input_data)
+
+
+def test_describe_two_datasets(tmp_path):
+    df = pd.read_csv(input_data, skipinitialspace=True)
+    df['age'] += 100
+    df['sex'] = df['sex'].str.upper() + '-' + df['sex']
+    df.to_csv(tmp_path / 'input.csv', index=False)
+
+    for parameters in [{}, {'chunksize': 300}]:
+        describer = DataDescriber(category_threshold=20, **parameters)
+        describer.describe_dataset_in_correlated_attribute_mode(dataset_file=input_data, epsilon=1, k=2, seed=0)
+        describer.describe_dataset_in_correlated_attribute_mode(dataset_file=tmp_path / 'input.csv', epsilon=1, k=2,
+                                                                seed=0)
+        describer.record_conditional_distributions_in_description()
+        assert describer.data_description == describe(tmp_path / 'input.csv', **parameters)
+        assert describer.data_description['attribute_description']['age']['min'] == 117
+
+
+def test_column_statistics():
+    random_state = np.random.RandomState(0)
+    column = pd.Series(random_state.randint(0, 500, 10000)).astype(float)
+    column[random_state.rand(10000) < 0.1] = np.nan
+    statistics = ColumnStatistics.from_column(column)
+    expected = ColumnStatistics.from_value_counts(column.value_counts(dropna=False))
+    assert vars(statistics) == vars(expected)
+    assert statistics.num_missing == column.isnull().sum() and statistics.num_distinct == column.nunique()
+    assert (statistics.min, statistics.max) == (column.min(), column.max()) and not statistics.is_unique
+
+    column = pd.Series(['a', 'bb', None, 'dddd'])
+    statistics = ColumnStatistics.from_column(column)
+    assert vars(statistics) == vars(ColumnStatistics.from_value_counts(column.value_counts(dropna=False)))
+    assert statistics.is_unique and (statistics.min_length, statistics.max_length) == (1, 4)
+
+    column = pd.Series(np.arange(300000))
+    statistics = ColumnStatistics.from_column(column, max_exact_distinct=1000)
+    assert not statistics.is_distinct_exact and statistics.is_unique
+    assert abs(statistics.num_distinct - 300000) < 0.03 * 300000
+    hashes = pd.util.hash_pandas_object(pd.Series(random_state.randint(0, 50000, 200000)), index=False).to_numpy()
+    assert abs(estimate_distinct_count(hashes) - np.unique(hashes).size) < 0.03 * np.unique(hashes).size
+
+
+def test_cached_description(tmp_path):
+    model_cache = ModelCache(tmp_path / 'cache')
+    described = describe(input_data, model_cache=model_cache)
+    assert len(list((tmp_path / 'cache').glob('*.json'))) == 1
+    assert describe(input_data, model_cache=model_cache) == described == describe(input_data)
+
+
+def test_description_for_epsilons():
+    epsilons = [0.5, 1, 2]
+    describer = DataDescriber(category_threshold=20)
+    descriptions = describer.describe_dataset_in_correlated_attribute_mode_for_epsilons(input_data, epsilons, k=2,
+                                                                                        seed=0)
+    assert list(descriptions) == epsilons
+    # each epsilon is described as in a single run seeded with the seed spawned for it
+    epsilon_seeds = np.random.SeedSequence(0).spawn(len(epsilons))
+    for epsilon, epsilon_seed in zip(epsilons, epsilon_seeds):
+        describer = DataDescriber(category_threshold=20)
+        describer.describe_dataset_in_correlated_attribute_mode(input_data, k=2, epsilon=epsilon,
+                                                                seed=int(epsilon_seed.generate_state(1)[0]))
+        describer.record_conditional_distributions_in_description()
+        assert descriptions[epsilon] == describer.data_description
+
+
+def test_description_with_workers(tmp_path):
+    model_cache = ModelCache(tmp_path / 'cache')
+    described = describe(input_data, model_cache=model_cache)
+    for num_workers in [2, 3]:
+        describer = DataDescriber(category_threshold=20)
+        describer.describe_dataset_in_correlated_attribute_mode(dataset_file=input_data, epsilon=1, k=2, seed=0,
+                                                                num_workers=num_workers)
+        describer.record_conditional_distributions_in_description()
+        assert describer.data_description == described
+
+        # the cached description is found whatever num_workers
+        describer = DataDescriber(category_threshold=20, model_cache=model_cache)
+        describer.describe_dataset_in_correlated_attribute_mode(dataset_file=input_data, epsilon=1, k=2, seed=0,
+                                                                num_workers=num_workers)
+        assert describer.conditional_distributions is None and describer.data_description == described
+    assert len(list((tmp_path / 'cache').glob('*.json'))) == 1
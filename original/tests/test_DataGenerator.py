@@ -0,0 +1,127 @@
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from original.DataSynthesizer.DataDescriber import DataDescriber
+from original.DataSynthesizer.DataGenerator import DataGenerator
+
+input_data = Path(__file__).parent / 'data' / 'adult_tiny.csv'
+
+
+@pytest.fixture(scope='module')
+def description_file(tmp_path_factory):
+    description_file = tmp_path_factory.mktemp('description') / 'description.json'
+    describer = DataDescriber(category_threshold=20)
+    describer.describe_dataset_in_correlated_attribute_mode(dataset_file=input_data, epsilon=1, k=2,
+                                                            attribute_to_is_categorical={'education': True})
+    describer.save_dataset_description_to_file(description_file)
+    return description_file
+
+
+@pytest.fixture(scope='module')
+def description_file_with_keys(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('description_with_keys')
+    df = pd.read_csv(input_data, skipinitialspace=True)
+    df.insert(0, 'id', np.arange(len(df)))
+    df['ssn'] = [f'{i:03d}-{i % 100:02d}-{i:04d}' for i in range(len(df))]
+    df.to_csv(directory / 'input.csv', index=False)
+
+    describer = DataDescriber(category_threshold=20)
+    describer.describe_dataset_in_correlated_attribute_mode(dataset_file=directory / 'input.csv', epsilon=1, k=2,
+                                                            attribute_to_is_candidate_key={'id': True, 'ssn': True})
+    describer.save_dataset_description_to_file(directory / 'description.json')
+    return directory / 'description.json'
+
+
+def test_sample_encoded_dataset(description_file):
+    with open(description_file) as file:
+        description = json.load(file)
+    np.random.seed(0)
+    n = 50000
+    encoded_df = DataGenerator.generate_encoded_dataset(n, description)
+
+    root = description['bayesian_network'][0][1][0]
+    root_frequencies = np.bincount(encoded_df[root], minlength=len(description['conditional_probabilities'][root])) / n
+    assert np.abs(root_frequencies - description['conditional_probabilities'][root]).sum() < 0.05
+
+    for child, parents in description['bayesian_network']:
+        for parents_instance, dist in description['conditional_probabilities'][child].items():
+            rows = (encoded_df[parents] == json.loads(parents_instance)).all(axis=1)
+            if rows.sum() < 2000:
+                continue
+            frequencies = np.bincount(encoded_df.loc[rows, child], minlength=len(dist)) / rows.sum()
+            assert np.abs(frequencies[:len(dist)] - dist).sum() < 0.1
+
+
+def test_streamed_generation(description_file_with_keys, tmp_path):
+    n, chunk_size = 2500, 1000
+    generator = DataGenerator()
+    generator.generate_dataset_in_correlated_attribute_mode(n, description_file_with_keys, seed=1,
+                                                            chunk_size=chunk_size)
+    in_memory = generator.synthetic_dataset
+    assert (in_memory['id'] == np.arange(n)).all()
+    assert in_memory['ssn'].is_unique
+
+    DataGenerator().generate_dataset_in_correlated_attribute_mode_to_file(
+        n, description_file_with_keys, tmp_path / 'synthetic.csv', seed=1, chunk_size=chunk_size)
+    streamed = pd.read_csv(tmp_path / 'synthetic.csv')
+    pd.testing.assert_frame_equal(streamed, pd.read_csv(io.StringIO(in_memory.to_csv(index=False))))
+
+
+def test_parallel_generation(description_file_with_keys, tmp_path):
+    n, chunk_size = 2500, 1000
+    serial, parallel = DataGenerator(), DataGenerator()
+    serial.generate_dataset_in_correlated_attribute_mode(n, description_file_with_keys, seed=2, chunk_size=chunk_size)
+    parallel.generate_dataset_in_correlated_attribute_mode(n, description_file_with_keys, seed=2,
+                                                           chunk_size=chunk_size, num_workers=2)
+    pd.testing.assert_frame_equal(serial.encoded_dataset, parallel.encoded_dataset)
+    pd.testing.assert_frame_equal(serial.synthetic_dataset, parallel.synthetic_dataset)
+
+    part_files = DataGenerator().generate_dataset_in_correlated_attribute_mode_to_file(
+        n, description_file_with_keys, tmp_path / 'synthetic.csv', seed=2, chunk_size=chunk_size, num_workers=2,
+        part_files=True)
+    assert [path.name for path in part_files] == ['synthetic-00000.csv', 'synthetic-00001.csv', 'synthetic-00002.csv']
+    streamed = pd.concat([pd.read_csv(path) for path in part_files], ignore_index=True)
+    expected = pd.read_csv(io.StringIO(serial.synthetic_dataset.to_csv(index=False)))
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+def test_compiled_model(description_file_with_keys, tmp_path):
+    with open(description_file_with_keys) as file:
+        description = json.load(file)
+    DataGenerator.save_compiled_model(description, tmp_path / 'model')
+    loaded_description, compiled_bn = DataGenerator.load_compiled_model(tmp_path / 'model')
+    assert 'conditional_probabilities' not in loaded_description
+    for (attr, parents, compiled), (expected_attr, expected_parents, expected) in zip(
+            compiled_bn, DataGenerator.compile_bayesian_network(description)):
+        assert (attr, parents) == (expected_attr, expected_parents)
+        assert compiled[0] == expected[0]
+        assert (compiled[1] is None) == (expected[1] is None)
+        np.testing.assert_array_equal(compiled[2], expected[2])
+
+    from_json, from_compiled_model = DataGenerator(), DataGenerator()
+    from_json.generate_dataset_in_correlated_attribute_mode(1000, description_file_with_keys, seed=3)
+    from_compiled_model.generate_dataset_in_correlated_attribute_mode(1000, tmp_path / 'model', seed=3)
+    pd.testing.assert_frame_equal(from_json.synthetic_dataset, from_compiled_model.synthetic_dataset)
+
+
+def test_chunks_in_flight():
+    num_tasks, num_workers = 20, 2
+    num_submitted = 0
+
+    def tasks():
+        nonlocal num_submitted
+        for task in range(num_tasks):
+            num_submitted += 1
+            yield -task
+
+    results = []
+    for result in DataGenerator.map_chunks(abs, tasks(), None, num_workers):
+        results.append(result)
+        # the pool does not take more tasks than it is allowed to have in flight
+        assert num_submitted - len(results) <= 2 * num_workers
+    assert results == list(range(num_tasks))
@@ -0,0 +1,37 @@
+import os
+
+from original.DataSynthesizer.ModelCache import ModelCache
+
+
+def test_model_cache(tmp_path):
+    dataset_file = tmp_path / 'input.csv'
+    dataset_file.write_text('a,b\n1,2\n')
+    cache = ModelCache(tmp_path / 'cache')
+
+    key = ModelCache.make_key(dataset_file, {'epsilon': 0.1, 'k': 2})
+    assert key == ModelCache.make_key(dataset_file, {'k': 2, 'epsilon': 0.1})
+    assert key != ModelCache.make_key(dataset_file, {'epsilon': 0.2, 'k': 2})
+    assert cache.load(key) is None
+    description = {'meta': {'num_tuples': 1}, 'bayesian_network': [['b', ['a']]]}
+    cache.save(key, description)
+    assert cache.load(key) == description
+
+    dataset_file.write_text('a,b\n1,3\n')
+    assert ModelCache.make_key(dataset_file, {'epsilon': 0.1, 'k': 2}) != key
+
+    # the least recently used descriptions are evicted beyond max_size
+    keys = [f'{idx:064x}' for idx in range(5)]
+    for idx, other_key in enumerate(keys):
+        cache.save(other_key, {'padding': 'x' * 200})
+        os.utime(cache.path(other_key), (idx + 10, idx + 10))
+    os.utime(cache.path(key), (0, 0))
+    cache.max_size = 1000
+    cache.evict()
+    cached = {path.stem for path in (tmp_path / 'cache').glob('*.json')}
+    assert key not in cached and keys[-1] in cached
+    assert sum(path.stat().st_size for path in (tmp_path / 'cache').glob('*.json')) <= 1000
+    assert not list((tmp_path / 'cache').glob('*.tmp'))
+
+    cache.clear()
+    assert cache.load(keys[-1]) is None
+    cache.clear()
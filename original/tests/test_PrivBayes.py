@@ -0,0 +1,294 @@
+import warnings
+from decimal import Decimal, localcontext
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+from pandas import DataFrame, read_csv
+
+from DataSynthesizer.lib import PrivBayes as baseline
+from DataSynthesizer.lib.utils import mutual_information
+from original.DataSynthesizer.DataGenerator import DataGenerator
+from src.original_priv_bayes import encode_dataset_into_codes, combine_codes, mutual_information_of_codes, \
+    construct_noisy_conditional_distributions, conditional_distributions_to_json, greedy_bayes, greedy_bayes_no_mp, \
+    JointCountsCache, ConstructionStats, calculate_k, exponential_mechanism, candidate_deltas, usefulness_minus_target, \
+    get_joint_counts, values_of_codes, codes_counts_to_joint_counts, compile_conditional_distributions, sample_child, \
+    entropies_of_codes, parents_pair_candidates, score_parents_pairs, select_parents_pair_with_pruning
+from src.priv_bayes import PrivBayes
+from src.sparse import unlisted_parents_distribution
+
+
+def make_dataset(num_tuples=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    dataset = DataFrame({f'a{idx}': rng.integers(0, cardinality, num_tuples)
+                         for idx, cardinality in enumerate([2, 5, 20, 3, 40])})
+    dataset['a5'] = (dataset['a1'] + dataset['a2']) % 9
+    return dataset
+
+
+def test_mutual_information_of_codes():
+    dataset = make_dataset()
+    dataset_str = dataset.astype(str)
+    codes, cardinalities = encode_dataset_into_codes(dataset)
+    attributes = list(dataset.columns)
+
+    for child in range(len(attributes)):
+        others = [idx for idx in range(len(attributes)) if idx != child]
+        for parents in list(combinations(others, 1)) + list(combinations(others, 3)):
+            parents = list(parents)
+            parents_key, parents_cardinality = combine_codes(codes, cardinalities, parents)
+            mi = mutual_information_of_codes(codes[:, child], cardinalities[child], parents_key, parents_cardinality)
+            expected = mutual_information(dataset_str[attributes[child]],
+                                          dataset_str[[attributes[parent] for parent in parents]])
+            assert np.isclose(mi, expected, rtol=0, atol=1e-12)
+
+
+def test_calculate_k():
+    filters = list(warnings.filters)
+    for num_attributes, num_tuples, epsilon, expected in [(15, 1000, 1, 2), (20, 1000, 1, 1), (100, 10 ** 5, 0.1, 2),
+                                                          (20, 10 ** 7, 1, 3)]:
+        k = calculate_k(num_attributes, num_tuples, epsilon=epsilon)
+        assert k == expected
+        if k != 3:
+            assert usefulness_minus_target(k, num_attributes, num_tuples, 4, epsilon) <= 0 < \
+                   usefulness_minus_target(k - 1, num_attributes, num_tuples, 4, epsilon)
+    assert warnings.filters == filters
+
+
+class UncachedMI(dict):
+    """MI cache that never hits, so that every candidate is scored in every round."""
+
+    def __contains__(self, key):
+        return False
+
+
+def test_mi_cache():
+    dataset = make_dataset()
+    for epsilon in [0, 1]:
+        stats = ConstructionStats()
+        mi_cache = {}
+        bayesian_network = greedy_bayes(dataset, 2, epsilon, seed=1, callback=stats, mi_cache=mi_cache)
+        assert greedy_bayes(dataset, 2, epsilon, seed=1, mi_cache=UncachedMI()) == bayesian_network
+        # only the candidates with the attribute added in the previous round are new
+        assert stats.cache_hits > 0 and stats.num_scored == len(mi_cache)
+        assert stats.num_scored + stats.cache_hits == sum(round_stats['num_candidates'] for round_stats in stats.rounds)
+
+        # all candidates are scored by the previous construction
+        stats = ConstructionStats()
+        assert greedy_bayes(dataset, 2, epsilon, seed=1, callback=stats, mi_cache=mi_cache) == bayesian_network
+        num_candidates = sum(round_stats['num_candidates'] for round_stats in stats.rounds)
+        assert stats.num_scored == 0 and stats.cache_hits == num_candidates
+
+
+def test_construction_callback():
+    dataset = make_dataset()
+    for construct in [greedy_bayes, greedy_bayes_no_mp]:
+        stats = ConstructionStats()
+        bayesian_network = construct(dataset, 2, 1, seed=1, callback=stats)
+        assert construct(dataset, 2, 1, seed=1) == bayesian_network
+        # one round per edge added after the root, reporting the child and the parents selected in it
+        assert [round_stats['round'] for round_stats in stats.rounds] == list(range(1, len(bayesian_network) + 1))
+        assert [(round_stats['child'], round_stats['parents']) for round_stats in stats.rounds] == bayesian_network
+        for round_stats in stats.rounds:
+            assert 0 < round_stats['num_scored'] <= round_stats['num_candidates'] and round_stats['seconds'] >= 0
+        assert stats.num_scored > 0 and stats.seconds == sum(round_stats['seconds'] for round_stats in stats.rounds)
+
+
+def test_exponential_mechanism_overflow():
+    rng = np.random.default_rng(0)
+    parents_pair_list = [(child, [parent]) for child in range(5) for parent in range(5) if parent != child]
+    mutual_info_list = rng.uniform(0, 3, len(parents_pair_list))
+    attr_to_is_binary = {idx: idx == 0 for idx in range(5)}
+    for epsilon in [1e3, 1e5]:
+        deltas = candidate_deltas(epsilon, parents_pair_list, attr_to_is_binary, 1000, 5)
+        with np.errstate(over='ignore'):
+            assert np.isinf(np.exp(mutual_info_list / (2 * deltas))).any()
+
+        distribution = exponential_mechanism(epsilon, mutual_info_list, parents_pair_list, attr_to_is_binary, 1000, 5)
+        assert np.isfinite(distribution).all()
+        with localcontext() as context:
+            context.prec = 50
+            context.Emax = 10 ** 9
+            weights = [(Decimal(mi) / (2 * Decimal(delta))).exp() for mi, delta in zip(mutual_info_list, deltas)]
+            expected = [float(weight / sum(weights)) for weight in weights]
+        np.testing.assert_allclose(distribution, expected, rtol=1e-9, atol=1e-300)
+
+
+def test_greedy_bayes_pruning():
+    dataset = make_dataset()
+    for k in [1, 2, 3]:
+        assert greedy_bayes_no_mp(dataset, k, 0, seed=1, prune=True) == greedy_bayes_no_mp(dataset, k, 0, seed=1)
+
+
+def test_pruning_with_epsilon():
+    dataset = make_dataset()
+    codes, cardinalities = encode_dataset_into_codes(dataset)
+    num_tuples, num_attributes = dataset.shape
+    entropies = entropies_of_codes(codes, cardinalities)
+    attr_to_is_binary = {idx: cardinality <= 2 for idx, cardinality in enumerate(cardinalities)}
+
+    def map_function(function, tasks):
+        return [function(task, codes, cardinalities) for task in tasks]
+
+    # a round with k=2 after a0, a1 and a2 are added, the candidates with one parent being scored in the previous ones
+    V = [0, 1, 2]
+    parents_pair_list = [parents_pair for child in range(3, 6) for split in range(2)
+                         for parents_pair in parents_pair_candidates((child, V, 2, split))]
+    previous_mi_cache = {}
+    score_parents_pairs([(child, [parent]) for child in range(3, 6) for parent in V], previous_mi_cache, map_function)
+    mutual_info_list = score_parents_pairs(parents_pair_list, dict(previous_mi_cache), map_function)
+
+    rng = np.random.default_rng(0)
+    num_draws = 2000
+    for epsilon in [0.1, 1]:
+        counts = np.zeros(len(parents_pair_list))
+        num_scored = []
+        for _ in range(num_draws):
+            mi_cache = dict(previous_mi_cache)
+            idx = select_parents_pair_with_pruning(epsilon, parents_pair_list, mi_cache, entropies, attr_to_is_binary,
+                                                   num_tuples, num_attributes, rng, map_function, batch_size=2)
+            counts[idx] += 1
+            num_scored.append(len(mi_cache) - len(previous_mi_cache))
+        expected = exponential_mechanism(epsilon, mutual_info_list, parents_pair_list, attr_to_is_binary, num_tuples,
+                                         num_attributes)
+        assert np.abs(counts / num_draws - expected).sum() < 0.1
+        if epsilon < 1:
+            # the bounds are tight with respect to delta, so few proposals are rejected
+            assert np.mean(num_scored) < len(parents_pair_list) / 2
+        else:
+            # the bounds are loose with respect to delta, so all candidates are scored rather than sampled
+            assert num_scored == [len(parents_pair_list)] * num_draws
+
+
+def test_conditional_distributions_against_baseline():
+    dataset = make_dataset()
+    for bayesian_network in [[('a1', ['a0']), ('a2', ['a1']), ('a3', ['a2']), ('a5', ['a1'])],
+                             [('a1', ['a0']), ('a2', ['a1', 'a0']), ('a3', ['a2', 'a1']), ('a4', ['a3', 'a0'])]]:
+        expected = baseline.construct_noisy_conditional_distributions(bayesian_network, dataset, epsilon=0)
+        conditional_distributions = construct_noisy_conditional_distributions(bayesian_network, dataset, epsilon=0)
+        conditional_distributions = conditional_distributions_to_json(bayesian_network, conditional_distributions)
+        assert conditional_distributions.keys() == expected.keys()
+        for attr, dist in expected.items():
+            if isinstance(dist, list):
+                assert np.allclose(conditional_distributions[attr], dist)
+            else:
+                assert conditional_distributions[attr].keys() == dist.keys()
+                for parents_instance, child_dist in dist.items():
+                    assert np.allclose(conditional_distributions[attr][parents_instance], child_dist)
+
+
+def test_sparse_conditional_distributions():
+    dataset = make_dataset(num_tuples=200)
+    bayesian_network = [('a1', ['a0']), ('a2', ['a1', 'a0']), ('a3', ['a2', 'a1']), ('a4', ['a3', 'a0'])]
+
+    dense = construct_noisy_conditional_distributions(bayesian_network, dataset, epsilon=0)
+    sparse = construct_noisy_conditional_distributions(bayesian_network, dataset, epsilon=0, max_dense_cells=10)
+    dense_json = conditional_distributions_to_json(bayesian_network, dense)
+    sparse_json = conditional_distributions_to_json(bayesian_network, sparse)
+
+    assert np.allclose(dense_json['a0'], sparse_json['a0'])
+    assert len(sparse_json['a3']) < len(dense_json['a3'])
+    for child, _ in bayesian_network:
+        assert set(sparse_json[child]) <= set(dense_json[child])
+        for parents_instance, dist in dense_json[child].items():
+            expected = sparse_json[child].get(parents_instance, unlisted_parents_distribution(len(dist)))
+            assert np.allclose(expected, dist)
+
+    # the unlisted parent values are sampled alike by PrivBayes and by DataGenerator from the JSON description
+    cardinalities = {attr: int(dataset[attr].max()) + 1 for attr in dataset}
+    description = {'bayesian_network': bayesian_network, 'conditional_probabilities': sparse_json,
+                   'attribute_description': {attr: {'distribution_bins': list(range(cardinality - 1))}
+                                             for attr, cardinality in cardinalities.items()}}
+    uniforms = np.random.default_rng(0).random(1000)
+    for child, parents, from_json in DataGenerator.compile_bayesian_network(description)[1:]:
+        parents_codes = [np.random.default_rng(1).integers(0, cardinalities[parent], 1000) for parent in parents]
+        assert np.array_equal(sample_child(from_json, parents_codes, uniforms),
+                              sample_child(compile_conditional_distributions(sparse[child]), parents_codes, uniforms))
+
+
+def test_joint_counts_out_of_range():
+    dataset = make_dataset()
+    # values out of the numerical range of an attribute are encoded as -1, and are not counted
+    dataset.loc[:99, 'a2'] = -1
+    in_range = dataset.iloc[100:]
+    dense = get_joint_counts(['a1', 'a2'], dataset)
+    sparse = get_joint_counts(['a1', 'a2'], dataset, max_dense_cells=10)
+    expected_counts = get_joint_counts(['a1', 'a2'], in_range)
+    assert np.array_equal(dense, expected_counts)
+    assert np.array_equal(sparse.to_dense(), expected_counts)
+
+    # the same counts are kept by greedy_bayes for the conditional distributions
+    counts_cache = JointCountsCache()
+    bayesian_network = greedy_bayes(dataset, 2, 1, seed=0, counts_cache=counts_cache)
+    for child, parents in bayesian_network:
+        np.testing.assert_array_equal(counts_cache.get(parents + [child]), get_joint_counts(parents + [child], dataset))
+    np.random.seed(0)
+    expected = construct_noisy_conditional_distributions(bayesian_network, dataset, 1)
+    np.random.seed(0)
+    cached = construct_noisy_conditional_distributions(bayesian_network, dataset, 1, counts_cache=counts_cache)
+    assert conditional_distributions_to_json(bayesian_network, cached) == \
+           conditional_distributions_to_json(bayesian_network, expected)
+
+    codes, cardinalities = encode_dataset_into_codes(dataset[['a1', 'a2']])
+    cells, counts = np.unique(codes, axis=0, return_counts=True)
+    values = values_of_codes(dataset[['a1', 'a2']], codes, cardinalities)
+    assert np.array_equal(codes_counts_to_joint_counts(cells, counts, values), expected_counts)
+    sparse = codes_counts_to_joint_counts(cells, counts, values, max_dense_cells=10)
+    assert np.array_equal(sparse.to_dense(), expected_counts)
+
+
+def test_counts_cache():
+    dataset = make_dataset()
+    bayesian_network = [('a1', ['a0']), ('a2', ['a1', 'a0']), ('a3', ['a2', 'a1']), ('a4', ['a3', 'a0'])]
+    counts_cache = JointCountsCache()
+    for max_dense_cells in [10 ** 7, 10]:
+        for epsilon in [0.1, 1]:
+            np.random.seed(0)
+            expected = construct_noisy_conditional_distributions(bayesian_network, dataset, epsilon,
+                                                                 max_dense_cells=max_dense_cells)
+            np.random.seed(0)
+            cached = construct_noisy_conditional_distributions(bayesian_network, dataset, epsilon,
+                                                               max_dense_cells=max_dense_cells,
+                                                               counts_cache=counts_cache)
+            assert conditional_distributions_to_json(bayesian_network, cached) == \
+                   conditional_distributions_to_json(bayesian_network, expected)
+        counts_cache.clear()
+
+
+def test_greedy_bayes_counts_cache():
+    dataset = make_dataset()
+    counts_cache = JointCountsCache()
+    bayesian_network = greedy_bayes(dataset, 2, 1, seed=0, counts_cache=counts_cache)
+    for child, parents in bayesian_network:
+        np.testing.assert_array_equal(counts_cache.get(parents + [child]), get_joint_counts(parents + [child], dataset))
+
+    # the counts of the edges already cached are not counted again
+    cached_counts = {child: counts_cache.get(parents + [child]) for child, parents in bayesian_network}
+    assert greedy_bayes(dataset, 2, 1, seed=0, counts_cache=counts_cache) == bayesian_network
+    for child, parents in bayesian_network:
+        assert counts_cache.get(parents + [child]) is cached_counts[child]
+
+
+def test_parallel_conditional_distributions():
+    dataset = make_dataset()
+    bayesian_network = [('a1', ['a0']), ('a2', ['a1', 'a0']), ('a3', ['a2', 'a1']), ('a4', ['a3', 'a0'])]
+    expected = construct_noisy_conditional_distributions(bayesian_network, dataset, 1, seed=1)
+    for num_workers in [2, 3]:
+        parallel = construct_noisy_conditional_distributions(bayesian_network, dataset, 1, seed=1,
+                                                             num_workers=num_workers)
+        assert conditional_distributions_to_json(bayesian_network, parallel) == \
+               conditional_distributions_to_json(bayesian_network, expected)
+
+
+def test_priv_bayes_fit_sample():
+    input_data = Path(__file__).parent / 'data' / 'adult_tiny.csv'
+    df_input = read_csv(input_data, skipinitialspace=True)
+
+    privatizer = PrivBayes(degree=2, epsilon=1).fit(df_input)
+    df_output = privatizer.sample(5000)
+
+    assert list(df_output.columns) == list(df_input.columns)
+    assert len(df_output) == 5000
+    for col in df_input:
+        assert set(df_output[col]) <= set(df_input[col])
+    assert privatizer.sample(10, seed=1).equals(privatizer.sample(10, seed=1))
@@ -0,0 +1,133 @@
+import warnings
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+from dateutil.parser import parse
+
+from original.DataSynthesizer.datatypes import are_datetimes, is_datetime, parse_json
+from original.DataSynthesizer.datatypes.DateTimeAttribute import parse_timestamps
+from original.DataSynthesizer.datatypes.FloatAttribute import FloatAttribute
+from original.DataSynthesizer.datatypes.SocialSecurityNumberAttribute import SocialSecurityNumberAttribute, are_ssns, \
+    is_ssn
+from original.DataSynthesizer.datatypes.StringAttribute import StringAttribute, generate_random_strings
+
+
+def make_attribute(data_type, is_categorical, distribution_bins, minimum, maximum):
+    return parse_json({'name': 'attribute', 'data_type': data_type, 'is_categorical': is_categorical,
+                       'is_candidate_key': False, 'min': minimum, 'max': maximum, 'missing_rate': 0.1,
+                       'distribution_bins': distribution_bins,
+                       'distribution_probabilities': [1 / len(distribution_bins)] * len(distribution_bins)})
+
+
+def test_sample_values_from_binning_indices():
+    attribute = make_attribute('Float', False, [0.0, 2.5, 5.0, 7.5], 0.0, 10.0)
+    binning_indices = pd.Series(np.random.RandomState(0).randint(4, size=1000))
+    values = attribute.sample_values_from_binning_indices(binning_indices)
+    expected = [attribute.uniform_sampling_within_a_bin(bin_idx) for bin_idx in binning_indices]
+    # both are uniform within the bins, the last one ending at the max
+    bins_of_values = np.searchsorted(attribute.distribution_bins, values, side='right') - 1
+    bins_of_expected = np.searchsorted(attribute.distribution_bins, expected, side='right') - 1
+    assert (bins_of_values == binning_indices).all() and (bins_of_expected == binning_indices).all()
+    assert values.max() <= attribute.max
+
+    # the last bin is the bin of missing values
+    values = attribute.sample_values_from_binning_indices(pd.Series([4, 0, 4]))
+    assert values.isnull().tolist() == [True, False, True]
+
+    attribute = make_attribute('String', True, ['a', 'b', 'c'], 1, 1)
+    values = attribute.sample_values_from_binning_indices(pd.Series([2, 0, 3, 1]))
+    assert values[:2].tolist() == ['c', 'a'] and np.isnan(values[2]) and values[3] == 'b'
+
+
+def test_generate_random_strings():
+    lengths = np.array([0, 3, 1, 0, 7, 5])
+    strings = generate_random_strings(lengths, np.random.RandomState(0))
+    assert [len(string) for string in strings] == lengths.tolist()
+    assert all(string.isalpha() and string.islower() for string in strings if string)
+    assert generate_random_strings(np.zeros(2, dtype=int)).tolist() == ['', '']
+
+    # the lengths of non-categorical strings are sampled from the bins of lengths
+    attribute = make_attribute('String', False, [1.0, 3.0], 1, 5)
+    values = attribute.sample_values_from_binning_indices(pd.Series([0, 1, 2, 1]))
+    assert values.isnull().tolist() == [False, False, True, False]
+    lengths = [len(value) for value in values[[0, 1, 3]]]
+    assert 1 <= lengths[0] <= 2 and 3 <= lengths[1] <= 4 and 3 <= lengths[2] <= 4
+
+
+def test_encode_values_into_bin_idx():
+    random_state = np.random.RandomState(0)
+    values = pd.Series(random_state.uniform(-5, 5, 1000))
+    values[random_state.rand(1000) < 0.1] = np.nan
+    attribute = FloatAttribute('attribute', False, False, 20, values)
+    attribute.infer_domain()
+    attribute.infer_distribution()
+    expected = values.map(lambda value: bisect_right(attribute.distribution_bins, value) - 1, na_action='ignore')
+    expected = expected.fillna(len(attribute.distribution_bins))
+    np.testing.assert_array_equal(attribute.encode_values_into_bin_idx(), expected)
+
+    values = pd.Series(random_state.choice(['x', 'y', 'z', None], 1000))
+    attribute = StringAttribute('attribute', False, True, 20, values)
+    attribute.infer_domain()
+    attribute.infer_distribution()
+    value_to_bin_idx = {value: idx for idx, value in enumerate(attribute.distribution_bins)}
+    expected = values.map(value_to_bin_idx.get, na_action='ignore').fillna(len(attribute.distribution_bins))
+    np.testing.assert_array_equal(attribute.encode_values_into_bin_idx(), expected)
+
+
+def test_parse_timestamps():
+    values = pd.Series(['2020-01-31 12:00:00', '1969-12-31 23:59:59', '2001-09-09 01:46:40', 'March 5, 1999',
+                        '07/04/1976', '2038-01-19 03:14:08', '1900-02-28 00:00:00'])
+    epoch_datetime = parse('1970-01-01')
+    expected = [int((parse(value) - epoch_datetime).total_seconds()) for value in values]
+    assert parse_timestamps(values).tolist() == expected
+
+    # ambiguous days are read month first by dateutil, in the sample or not
+    for values in [pd.Series(['13/02/2020', '25/12/1999', '01/02/2020', '31/01/2021']),
+                   pd.Series(['13/02/2020'] * 5 + ['01/02/2020', '12/11/2010']),
+                   pd.Series(['01/02/2020', '13/02/2020', '25/12/1999'] * 50 + ['05/06/2007'])]:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            timestamps = parse_timestamps(values)
+        assert timestamps.tolist() == [int((parse(value) - epoch_datetime).total_seconds()) for value in values]
+    assert parse_timestamps(pd.Series(['13/02/2020', '01/02/2020']))[1] == 1577923200
+    assert parse_timestamps(pd.Series(['13/02/2020'] * 5 + ['01/02/2020']), sample_size=5)[5] == 1577923200
+
+    # fractions of seconds are truncated
+    values = pd.Series(['2020-01-01 10:00:00.9999999', '2020-01-01 10:00:00.5', '1969-12-31 23:59:59.25',
+                        '1969-12-31 23:59:58.999999'])
+    assert parse_timestamps(values).tolist() == [1577872800, 1577872800, 0, -1]
+
+
+def test_are_datetimes():
+    values = pd.Series(['2020-01-31', '2020-02-29', 'Monday', 'january', '12/31/1999', 'not a date', '12', '2020-13-01',
+                        'Mar 5 1999 10:00', 'x2020-01-01'])
+    assert are_datetimes(values).tolist() == [is_datetime(value) for value in values]
+
+
+def test_are_ssns():
+    values = pd.Series(['123-45-6789', '000-00-0000', '1234567890', '12-345', 'abc-de-fghi', '', '999999999', '-5'])
+    assert are_ssns(values).tolist() == [is_ssn(value) for value in values]
+    values = pd.Series([0, 1, 123456789, 999999999, 1000000000, -3])
+    assert are_ssns(values).tolist() == [is_ssn(value) for value in values.tolist()]
+
+
+def test_candidate_keys_in_chunks():
+    n, chunk_size = 1000, 300
+    chunks = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+    attribute = SocialSecurityNumberAttribute('ssn', True, False, 20, pd.Series(dtype=int))
+    values = attribute.generate_values_as_candidate_key(n, seed=0)
+    # the chunks generate the values of a single shuffle of the whole range
+    assert sum((attribute.generate_values_as_candidate_key(n, start, stop, seed=0) for start, stop in chunks),
+               []) == values
+    expected = [f'{value:09d}' for value in np.linspace(0, 1e9 - 1, num=n, dtype=int)]
+    assert sorted(values) == [f'{value[:3]}-{value[3:5]}-{value[5:]}' for value in expected]
+    assert values[:chunk_size] != sorted(values)[:chunk_size]
+
+    attribute = make_attribute('String', False, [1.0, 3.0], 1, 5)
+    values = np.concatenate([attribute.generate_values_as_candidate_key(n, start, stop, seed=0)
+                             for start, stop in chunks])
+    # the random prefixes have the same length in all chunks
+    assert len({len(value) - len(str(idx)) for idx, value in enumerate(values)}) == 1
+    assert all(value.endswith(str(idx)) for idx, value in enumerate(values)) and len(set(values)) == n
@@ -20,7 +20,8 @@ print()
 from src.priv_bayes import PrivBayes
 
 privatizer = PrivBayes(degree=3)
-privatizer.greedy_bayes(data=data)
+privatizer.fit(data.data)
+synthetic_data = privatizer.sample(len(data.data))
 
 
 
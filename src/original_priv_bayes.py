@@ -1,15 +1,25 @@
+import logging
+import os
 import random
-import warnings
-from itertools import combinations, product, islice, chain
-from math import log, ceil
-from multiprocessing.pool import Pool
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from itertools import combinations, product
+from math import log, exp
+from multiprocessing.pool import Pool, ThreadPool
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List
 
 import numpy as np
 import pandas as pd
-from pandas import DataFrame, merge
-from scipy.optimize import fsolve
+from pandas import DataFrame
 
-from DataSynthesizer.lib.utils import mutual_information, normalize_given_distribution, set_random_seed
+from DataSynthesizer.lib.utils import set_random_seed
+from src.sparse import domain_size, sample_empty_cells, unlisted_parents_distribution, SparseCounts, \
+    SparseConditionalDistribution
 
 """
 This module is based on PrivBayes in the following paper:
@@ -18,9 +28,76 @@ Zhang J, Cormode G, Procopiuc CM, Srivastava D, Xiao X.
 PrivBayes: Private Data Release via Bayesian Networks.
 """
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
-def greedy_bayes_no_mp(dataset: DataFrame, k: int, epsilon: float, seed=0):
-    """Construct a Bayesian Network (BN) using greedy algorithm.
+logger = logging.getLogger(__name__)
+
+# Joint distributions over more cells than this are stored sparsely, see get_sparse_noisy_distribution_of_attributes.
+MAX_DENSE_CELLS = 10 ** 7
+
+# Encoded dataset shared by the workers of greedy_bayes, published once per run instead of being pickled per task.
+_shared_codes = None
+_shared_cardinalities = None
+
+
+class ConstructionStats:
+    """Callback of greedy_bayes collecting the statistics of each round of the BN construction.
+
+    Attributes
+    ----------
+    rounds : list
+        List of dictionaries with keys "round", "child", "parents", "num_candidates", "num_scored", "cache_hits",
+        "seconds" and "peak_memory" (peak resident memory of the process in bytes, None where it is unknown).
+    """
+
+    def __init__(self):
+        self.rounds: List[Dict] = []
+
+    def __call__(self, round_stats):
+        self.rounds.append(round_stats)
+
+    @property
+    def seconds(self):
+        return sum(round_stats['seconds'] for round_stats in self.rounds)
+
+    @property
+    def num_scored(self):
+        return sum(round_stats['num_scored'] for round_stats in self.rounds)
+
+    @property
+    def cache_hits(self):
+        return sum(round_stats['cache_hits'] for round_stats in self.rounds)
+
+
+def _peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _record_round(callback, round_number, child, parents, num_candidates, num_scored, start_time):
+    """Report the statistics of a round of the BN construction to the callback and the debug log."""
+    round_stats = {'round': round_number,
+                   'child': child,
+                   'parents': parents,
+                   'num_candidates': num_candidates,
+                   'num_scored': num_scored,
+                   'cache_hits': num_candidates - num_scored,
+                   'seconds': perf_counter() - start_time,
+                   'peak_memory': _peak_memory()}
+    logger.debug('Round %(round)d: added %(child)s, %(num_candidates)d candidates, %(num_scored)d scored, '
+                 '%(cache_hits)d cache hits, %(seconds).3f s, peak memory %(peak_memory)s bytes', round_stats)
+    if callback is not None:
+        callback(round_stats)
+
+
+def greedy_bayes_no_mp(dataset: DataFrame, k: int, epsilon: float, seed=0, callback=None, prune=False):
+    """Construct a Bayesian Network (BN) using greedy algorithm, without multiprocessing.
 
     Parameters
     ----------
@@ -30,77 +107,70 @@ def greedy_bayes_no_mp(dataset: DataFrame, k: int, epsilon: float, seed=0):
         Maximum degree of the constructed BN. If k=0, k is automatically calculated.
     epsilon : float
         Parameter of differential privacy.
-    seed : int or float
+    seed : int
         Seed for the randomness in BN generation.
+    callback : callable, optional
+        Called with a dictionary of statistics after each round, e.g., a ConstructionStats.
+    prune : bool
+        Skip the candidates that cannot be selected, using upper bounds of their MI (see
+        select_parents_pair_with_pruning). The BN is unchanged if epsilon=0, and has the same distribution otherwise.
     """
-
-    # k è il numero massimo di parent che puoi avere
-
-    print('================ Inizio ================')
     set_random_seed(seed)
-    dataset: DataFrame = dataset.astype(str, copy=False)
+    rng = np.random.default_rng(seed)
+    attributes = list(dataset.columns)
+    codes, cardinalities = encode_dataset_into_codes(dataset)
     num_tuples, num_attributes = dataset.shape
-    print(f'dataset con {num_tuples} tuples and {num_attributes} attributes')
-    print(f'attributes: {dataset.columns}')
-    print(f'calcolo k se non dato. k attuale {k}')
+    # k è il numero massimo di parent che puoi avere
     if not k:
         k = calculate_k(num_attributes, num_tuples)
-        print(f'valore di k calcolato {k}')
-    attr_to_is_binary = {attr: dataset[attr].unique().size <= 2 for attr in dataset}
-    print(f'attributi binari {attr_to_is_binary}')
-
-    print('================ Constructing Bayesian Network (BN) ================')
-    root_attribute = random.choice(dataset.columns)
-    V = [root_attribute]
-    rest_attributes = list(dataset.columns)
-    rest_attributes.remove(root_attribute)
-    print(f'Adding ROOT {root_attribute}')
-    print(f'attributi rimanenti {rest_attributes}')
+    logger.debug('Dataset with %d tuples and %d attributes, k=%d', num_tuples, num_attributes, k)
+    attr_to_is_binary = {idx: cardinality <= 2 for idx, cardinality in enumerate(cardinalities)}
+    entropies = entropies_of_codes(codes, cardinalities) if prune else None
+    # the encoded dataset is bound to the serial map, rather than published in the module globals of the workers
+    map_function = partial(_map_on_dataset, codes=codes, cardinalities=cardinalities)
+
+    logger.info('Constructing Bayesian Network (BN)')
+    root_attribute = random.choice(attributes)
+    V = [attributes.index(root_attribute)]
+    rest_attributes = list(range(num_attributes))
+    rest_attributes.remove(V[0])
+    logger.info('Adding ROOT %s', root_attribute)
     bay_net = []
+    mi_cache = {}
     while rest_attributes:
-        print(f'============ NUOVA ASSEGNAZIONE: rimangono {len(rest_attributes)} attributi =================')
+        start_time = perf_counter()
         parents_pair_list = []
-        mutual_info_list = []
 
         num_parents = min(len(V), k)
-        print('num parents ', num_parents)
-        tasks = [(child, V, num_parents, split, dataset) for child, split in
+        tasks = [(child, V, num_parents, split) for child, split in
                  product(rest_attributes, range(len(V) - num_parents + 1))]
-        print(f'TASK DA SVOLGERE {len(tasks)}')
-        print('range', len(V) - num_parents + 1)
 
-        res_list = []
-        # ogni task cerca il migliore set di parent per un dato attributo tra quelli rimanenti
-        i = 0
+        # ogni task elenca i set di parent candidati per un dato attributo tra quelli rimanenti
         for task in tasks:
-            i += 1
-            print(f'--- lancio worker {i} su {len(tasks)}')
-            res = worker(task)
-            res_list.append(res)
-            print(f'--- worker terminato. Il risultato è {res}')
-
-        for res in res_list:
-            parents_pair_list += res[0]
-            mutual_info_list += res[1]
-
-        print('parents_pair_list: ', parents_pair_list)
-        print('mutual_info_list: ', mutual_info_list)
-
-        if epsilon:
-            sampling_distribution = exponential_mechanism(epsilon, mutual_info_list, parents_pair_list, attr_to_is_binary,
-                                                          num_tuples, num_attributes)
-            idx = np.random.choice(list(range(len(mutual_info_list))), p=sampling_distribution)
+            parents_pair_list += parents_pair_candidates(task)
+        # la mutual information viene calcolata solo per le coppie non ancora presenti in mi_cache
+        num_cached = len(mi_cache)
+        if prune:
+            idx = select_parents_pair_with_pruning(epsilon, parents_pair_list, mi_cache, entropies, attr_to_is_binary,
+                                                   num_tuples, num_attributes, rng, map_function)
         else:
-            idx = mutual_info_list.index(max(mutual_info_list))
-
-        bay_net.append(parents_pair_list[idx])
-        adding_attribute = parents_pair_list[idx][0]
-        V.append(adding_attribute)
-        rest_attributes.remove(adding_attribute)
-        print(f'-> Adding attribute {adding_attribute}')
-        print(f'-> Added edge {parents_pair_list[idx]}')
-
-    print('========================== BN constructed ==========================')
+            mutual_info_list = score_parents_pairs(parents_pair_list, mi_cache, map_function)
+            if epsilon:
+                sampling_distribution = exponential_mechanism(epsilon, mutual_info_list, parents_pair_list,
+                                                              attr_to_is_binary, num_tuples, num_attributes)
+                idx = rng.choice(len(mutual_info_list), p=sampling_distribution)
+            else:
+                idx = mutual_info_list.index(max(mutual_info_list))
+
+        child, parents = parents_pair_list[idx]
+        bay_net.append((attributes[child], [attributes[parent] for parent in parents]))
+        V.append(child)
+        rest_attributes.remove(child)
+        logger.info('Adding attribute %s', attributes[child])
+        _record_round(callback, len(bay_net), *bay_net[-1], len(parents_pair_list), len(mi_cache) - num_cached,
+                      start_time)
+
+    logger.info('BN constructed')
 
     return bay_net
 
@@ -118,7 +188,24 @@ def calculate_sensitivity(num_tuples, child, parents, attr_to_is_binary):
     int
         Sensitivity value.
     """
-    if attr_to_is_binary[child] or (len(parents) == 1 and attr_to_is_binary[parents[0]]):
+    is_binary = attr_to_is_binary[child] or (len(parents) == 1 and attr_to_is_binary[parents[0]])
+    return _sensitivity(num_tuples, is_binary)
+
+
+def sensitivity_lookup_table(num_tuples):
+    """Both values of the sensitivity in PrivBayes Lemma 1, which only depends on whether the child, or its single
+    parent, is binary.
+
+    Return
+    --------
+    np.ndarray
+        Array of [non-binary sensitivity, binary sensitivity].
+    """
+    return np.array([_sensitivity(num_tuples, False), _sensitivity(num_tuples, True)])
+
+
+def _sensitivity(num_tuples, is_binary):
+    if is_binary:
         a = log(num_tuples) / num_tuples
         b = (num_tuples - 1) / num_tuples
         b_inv = num_tuples / (num_tuples - 1)
@@ -162,7 +249,6 @@ def usefulness_minus_target(k, num_attributes, num_tuples, target_usefulness=5,
         Parameter of differential privacy.
     """
     if k == num_attributes:
-        print('here')
         usefulness = target_usefulness
     else:
         usefulness = num_tuples * epsilon / ((num_attributes - k) * (2 ** (k + 3)))  # PrivBayes Lemma 3
@@ -170,31 +256,147 @@ def usefulness_minus_target(k, num_attributes, num_tuples, target_usefulness=5,
 
 
 def calculate_k(num_attributes, num_tuples, target_usefulness=4, epsilon=0.1):
-    """Calculate the maximum degree when constructing Bayesian networks. See PrivBayes Lemma 3."""
+    """Calculate the maximum degree when constructing Bayesian networks. See PrivBayes Lemma 3.
+
+    The usefulness decreases with k, except close to num_attributes, so the ceiling of the root of
+    usefulness_minus_target is the smallest integer k whose usefulness is at most target_usefulness, found by a direct
+    search. The default degree is kept if its usefulness is larger than target_usefulness, or if the root is not
+    positive, i.e., even k=0 is not useful enough.
+    """
     default_k = 3
     initial_usefulness = usefulness_minus_target(default_k, num_attributes, num_tuples, 0, epsilon)
     if initial_usefulness > target_usefulness:
         return default_k
-    else:
-        arguments = (num_attributes, num_tuples, target_usefulness, epsilon)
-        warnings.filterwarnings("error")
-        try:
-            ans = fsolve(usefulness_minus_target, np.array([int(num_attributes / 2)]), args=arguments)[0]
-            ans = ceil(ans)
-        except RuntimeWarning:
-            print("Warning: k is not properly computed!")
-            ans = default_k
-        if ans < 1 or ans > num_attributes:
-            ans = default_k
-        return ans
+    for k in range(num_attributes):
+        if usefulness_minus_target(k, num_attributes, num_tuples, target_usefulness, epsilon) <= 0:
+            return k or default_k
+    return default_k
+
 
+def encode_dataset_into_codes(dataset: DataFrame):
+    """Factorize every attribute into integer codes, so that MI is computed from integer contingency counts.
 
-def worker(paras):
+    Values are told apart by their string representation, as in the string-based MI, and missing values get a
+    code of their own.
+
+    Parameters
+    ----------
+    dataset : DataFrame
+        Input dataset, which only contains categorical attributes.
+
+    Returns
+    --------
+    codes : np.ndarray
+        Array of shape (num_tuples, num_attributes), stored column by column, with codes in [0, cardinality).
+    cardinalities : np.ndarray
+        Number of distinct codes of each attribute.
+    """
+    num_tuples, num_attributes = dataset.shape
+    codes = np.empty((num_tuples, num_attributes), dtype=np.int64, order='F')
+    cardinalities = np.empty(num_attributes, dtype=np.int64)
+    for idx, attr in enumerate(dataset):
+        column = dataset[attr]
+        if column.dtype == object:
+            column = column.astype(str)
+        column_codes, uniques = pd.factorize(column)
+        cardinality = uniques.size
+        missing = column_codes < 0
+        if missing.any():
+            column_codes[missing] = cardinality
+            cardinality += 1
+        codes[:, idx] = column_codes
+        cardinalities[idx] = cardinality
+    return codes, cardinalities
+
+
+def combine_codes(codes, cardinalities, attribute_indices):
+    """Combine the codes of several attributes into a single mixed-radix key.
+
+    The key is re-factorized whenever its cardinality would exceed the number of tuples, so that contingency tables
+    built on it stay bounded by the dataset size.
+
+    Returns
+    --------
+    key : np.ndarray
+        One code per tuple identifying the joint value of the attributes.
+    cardinality : int
+        Upper bound (exclusive) of the key.
     """
-    Restituisce una lista di attributi child - parent e di relativi valori di mutual information
+    num_tuples = codes.shape[0]
+    key = codes[:, attribute_indices[0]]
+    cardinality = int(cardinalities[attribute_indices[0]])
+    for idx in attribute_indices[1:]:
+        if cardinality * int(cardinalities[idx]) > max(num_tuples, 1):
+            uniques, key = np.unique(key, return_inverse=True)
+            cardinality = uniques.size
+        key = key * cardinalities[idx] + codes[:, idx]
+        cardinality *= int(cardinalities[idx])
+    return key, cardinality
+
+
+def mutual_information_of_codes(child_codes, child_cardinality, parents_key, parents_cardinality):
+    """Mutual information of integer-coded attributes, from np.bincount contingency tables.
+
+    It follows the computation of sklearn.metrics.mutual_info_score, so that it matches the string-based MI.
     """
+    num_tuples = child_codes.size
+    child_cardinality = int(child_cardinality)
+    pi = np.bincount(child_codes, minlength=child_cardinality)
+    pj = np.bincount(parents_key, minlength=parents_cardinality)
+    # MI <= min(H(X), H(Y)), so an attribute with a single value has no mutual information.
+    if np.count_nonzero(pi) <= 1 or np.count_nonzero(pj) <= 1:
+        return 0.0
+
+    joint = child_codes * parents_cardinality + parents_key
+    size = child_cardinality * parents_cardinality
+    if size <= 4 * num_tuples:
+        contingency = np.bincount(joint, minlength=size)
+        nz = np.flatnonzero(contingency)
+        nz_val = contingency[nz]
+    else:
+        nz, nz_val = np.unique(joint, return_counts=True)
+    nzx, nzy = np.divmod(nz, parents_cardinality)
+
+    log_contingency_nm = np.log(nz_val)
+    contingency_nm = nz_val / num_tuples
+    outer = pi.take(nzx).astype(np.int64, copy=False) * pj.take(nzy).astype(np.int64, copy=False)
+    log_outer = -np.log(outer) + 2 * log(num_tuples)
+    mi = contingency_nm * (log_contingency_nm - log(num_tuples)) + contingency_nm * log_outer
+    mi = np.where(np.abs(mi) < np.finfo(mi.dtype).eps, 0.0, mi)
+    return float(np.clip(mi.sum(), 0.0, None))
 
 
+def _set_shared_dataset(codes, cardinalities):
+    global _shared_codes, _shared_cardinalities
+    _shared_codes = codes
+    _shared_cardinalities = cardinalities
+
+
+def _map_on_dataset(function, tasks, codes, cardinalities):
+    """Serial map of worker over tasks, on an encoded dataset given explicitly instead of the shared one."""
+    return [function(task, codes, cardinalities) for task in tasks]
+
+
+def _init_worker(codes_file, cardinalities):
+    """Pool initializer: memory-map the encoded dataset published by greedy_bayes."""
+    _set_shared_dataset(np.load(codes_file, mmap_mode='r'), cardinalities)
+
+
+@contextmanager
+def _worker_pool(codes, cardinalities):
+    """A Pool living for a whole BN construction, whose workers memory-map the encoded dataset written once to disk."""
+    with TemporaryDirectory() as tmp_dir:
+        codes_file = os.path.join(tmp_dir, 'codes.npy')
+        np.save(codes_file, codes)
+        with Pool(initializer=_init_worker, initargs=(codes_file, cardinalities)) as pool:
+            yield pool
+
+
+def parents_pair_candidates(paras):
+    """
+    Restituisce la lista delle coppie child - parents candidate per un dato child e split
+    """
+
     # child è l'attributo che cerco di instanziare come attributo figlio
     # viene preso dalla lista degli attributi rimanenti
     # ---
@@ -206,37 +408,158 @@ def worker(paras):
     # split non è chiaro a cosa serva. Va da 0 a len(V) - n_parents + 1
     #
     # ---
-    # dataset è il dataset, utile per calcolare le metriche
-    child, V, num_parents, split, dataset = paras
-    print(f'-----> CHIAMATA AL WORKER. child {child}, V {V}, N parents {num_parents}, split {split}')
+    # child e V sono indici di colonna nel dataset codificato in interi
+    child, V, num_parents, split = paras
 
     parents_pair_list = []
-    mutual_info_list = []
 
     # in pratica questo controlla che non superi il valore ????
-    print('split', split, type(split))
-    print('num_parents', num_parents, type(num_parents))
     if split + num_parents - 1 < len(V):
         # split sembra che serva a considerare uno specifico parent
         # gli other parents sono tutti i parent a destra del parent selezionato dallo split
         # combinations ha come primo argomento la lista di elementi di cui si vogliono ottenere le combinazioni
         # come secondo argomento ha il numero di elementi all'interno della combinazione
         for other_parents in combinations(V[split + 1:], num_parents - 1):
-            print('combinazioni valutate di other parents', list(combinations(V[split + 1:], num_parents - 1)))
             parents = list(other_parents)
             parents.append(V[split])
-            print(f'other parents: {other_parents}, added parent {V[split]}')
             # coppia child parents candidata
             parents_pair_list.append((child, parents))
-            # TODO consider to change the computation of MI by combined integers instead of strings.
-            mi = mutual_information(dataset[child], dataset[parents])
-            # calcolato con scikit
-            mutual_info_list.append(mi)
 
-    return parents_pair_list, mutual_info_list
+    return parents_pair_list
+
+
+def worker(paras, codes=None, cardinalities=None):
+    """
+    Restituisce i valori di mutual information tra un child e ciascuno dei parent set dati
+    """
+
+    # il dataset codificato in interi, utile per calcolare le metriche, è condiviso una sola volta per processo
+    # (vedi _init_worker), quindi child e parents sono indici di colonna in _shared_codes, a meno che il dataset
+    # sia passato esplicitamente (vedi _map_on_dataset)
+    child, parents_list = paras
+    if codes is None:
+        codes, cardinalities = _shared_codes, _shared_cardinalities
+
+    mutual_info_list = []
+    child_codes = codes[:, child]
+    for parents in parents_list:
+        parents_key, parents_cardinality = combine_codes(codes, cardinalities, parents)
+        mi = mutual_information_of_codes(child_codes, cardinalities[child], parents_key, parents_cardinality)
+        # stesso valore di mutual_info_score di scikit sulle stringhe
+        mutual_info_list.append(mi)
+
+    return mutual_info_list
+
+
+def score_parents_pairs(parents_pair_list, mi_cache, map_function=map, task_size=64):
+    """Mutual information of each (child, parents) pair, computing only the pairs missing from mi_cache.
+
+    Parameters
+    ----------
+    parents_pair_list : list
+        List of (child, parents) candidates of a round of greedy_bayes.
+    mi_cache : dict
+        Dictionary of {(child, frozenset(parents)): mutual information}, shared by all rounds of a BN construction.
+        It is updated in place with the newly computed pairs.
+    map_function : callable
+        Function applying worker to the tasks, e.g., the map of a Pool.
+    task_size : int
+        Maximum number of parent sets scored by one worker task.
+    """
+    keys = [(child, frozenset(parents)) for child, parents in parents_pair_list]
+    child_to_missing_parents = {}
+    missing_keys = set()
+    for (child, parents), key in zip(parents_pair_list, keys):
+        if key not in mi_cache and key not in missing_keys:
+            missing_keys.add(key)
+            child_to_missing_parents.setdefault(child, []).append(parents)
+
+    tasks = [(child, parents_list[i:i + task_size]) for child, parents_list in child_to_missing_parents.items()
+             for i in range(0, len(parents_list), task_size)]
+    for (child, parents_list), mutual_info_list in zip(tasks, map_function(worker, tasks)):
+        for parents, mi in zip(parents_list, mutual_info_list):
+            mi_cache[(child, frozenset(parents))] = mi
+
+    return [mi_cache[key] for key in keys]
+
+
+def joint_counts_worker(attribute_indices):
+    """Exact joint counts of attributes of the shared encoded dataset (see _init_worker).
+
+    Return
+    --------
+    tuple
+        (cells, counts) of the non-zero cells, where cells is an array of shape (num_cells, len(attribute_indices)) of
+        the codes of the attributes, sorted lexicographically.
+    """
+    codes, cardinalities = _shared_codes, _shared_cardinalities
+    shape = tuple(int(cardinalities[idx]) for idx in attribute_indices)
+    keys = np.ravel_multi_index(tuple(codes[:, idx] for idx in attribute_indices), shape)
+    size = domain_size(shape)
+    if size <= 4 * codes.shape[0]:
+        counts = np.bincount(keys, minlength=size)
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    else:
+        keys, counts = np.unique(keys, return_counts=True)
+    return np.column_stack(np.unravel_index(keys, shape)).reshape(-1, len(shape)), counts
+
+
+def values_of_codes(dataset: DataFrame, codes, cardinalities):
+    """Value of each code of each attribute, i.e., the inverse of encode_dataset_into_codes for a dataset of integers
+    without missing values."""
+    code_values = []
+    for idx, attr in enumerate(dataset):
+        values = np.zeros(int(cardinalities[idx]), dtype=np.int64)
+        values[codes[:, idx]] = dataset[attr].to_numpy()
+        code_values.append(values)
+    return code_values
+
+
+def _store_joint_counts(pending_counts, counts_cache, attributes, code_values, wait=False):
+    """Store the results of joint_counts_worker into counts_cache, and return the ones that are not ready yet."""
+    not_ready = []
+    for attribute_indices, result in pending_counts:
+        if wait or result.ready():
+            cells, counts = result.get()
+            values = [code_values[idx] for idx in attribute_indices]
+            counts_cache[tuple(attributes[idx] for idx in attribute_indices)] = codes_counts_to_joint_counts(
+                cells, counts, values)
+        else:
+            not_ready.append((attribute_indices, result))
+    return not_ready
+
+
+def codes_counts_to_joint_counts(cells, counts, values, max_dense_cells=MAX_DENSE_CELLS):
+    """Convert joint counts over codes into joint counts over values, in the format of get_joint_counts.
+
+    Parameters
+    ----------
+    cells : np.ndarray
+        Array of shape (num_cells, num_attributes) of the codes of the non-zero cells.
+    counts : np.ndarray
+        Counts of the cells.
+    values : list
+        Arrays of the value of each code of each attribute, see values_of_codes.
+
+    As in get_joint_counts, the cells with a negative value, i.e., a value out of the numerical range of an attribute,
+    are not counted.
+    """
+    shape = tuple(int(attr_values.max()) + 1 for attr_values in values)
+    cells = np.column_stack([attr_values[cells[:, idx]] for idx, attr_values in enumerate(values)])
+    cells = cells.reshape(-1, len(shape))
+    in_range = (cells >= 0).all(axis=1)
+    cells, counts = cells[in_range], counts[in_range].astype(float)
+    if domain_size(shape) > max_dense_cells:
+        order = np.argsort(np.ravel_multi_index(tuple(cells.T), shape), kind='stable')
+        return SparseCounts(shape, cells[order], counts[order])
+    stats = np.zeros(shape)
+    np.add.at(stats, tuple(cells.T), counts)
+    return stats
 
 
-def greedy_bayes(dataset: DataFrame, k: int, epsilon: float, seed=0):
+def greedy_bayes(dataset: DataFrame, k: int, epsilon: float, seed=0, codes=None, cardinalities=None, callback=None,
+                 prune=False, mi_cache=None, counts_cache=None):
     """Construct a Bayesian Network (BN) using greedy algorithm.
 
     Parameters
@@ -247,68 +570,252 @@ def greedy_bayes(dataset: DataFrame, k: int, epsilon: float, seed=0):
         Maximum degree of the constructed BN. If k=0, k is automatically calculated.
     epsilon : float
         Parameter of differential privacy.
-    seed : int or float
+    seed : int
         Seed for the randomness in BN generation.
+    codes : np.ndarray, optional
+    cardinalities : np.ndarray, optional
+        Output of encode_dataset_into_codes for dataset, when it is already encoded.
+    callback : callable, optional
+        Called with a dictionary of statistics after each round, e.g., a ConstructionStats.
+    prune : bool
+        Skip the candidates that cannot be selected, using upper bounds of their MI (see
+        select_parents_pair_with_pruning). The BN is unchanged if epsilon=0, and has the same distribution otherwise.
+    mi_cache : dict, optional
+        MI of the candidates scored by a previous construction on the same dataset, e.g., at another epsilon, as
+        {(child, frozenset(parents)): mutual information}. It is updated in place.
+    counts_cache : JointCountsCache, optional
+        Cache receiving the exact joint counts of the parents and the child of every edge of the BN, for
+        construct_noisy_conditional_distributions. They are counted by the workers while the next rounds are scored,
+        unless they are already cached. The dataset must be encoded into binning indices, as the axes of the counts
+        are indexed by the values.
     """
     set_random_seed(seed)
-    dataset: DataFrame = dataset.astype(str, copy=False)
+    rng = np.random.default_rng(seed)
+    attributes = list(dataset.columns)
+    if codes is None:
+        codes, cardinalities = encode_dataset_into_codes(dataset)
     num_tuples, num_attributes = dataset.shape
     if not k:
         k = calculate_k(num_attributes, num_tuples)
+    logger.debug('Dataset with %d tuples and %d attributes, k=%d', num_tuples, num_attributes, k)
+    if counts_cache is not None:
+        code_values = values_of_codes(dataset, codes, cardinalities)
+        pending_counts = []
+
+    attr_to_is_binary = {idx: cardinality <= 2 for idx, cardinality in enumerate(cardinalities)}
+    entropies = entropies_of_codes(codes, cardinalities) if prune else None
+
+    logger.info('Constructing Bayesian Network (BN)')
+    root_attribute = random.choice(attributes)
+    V = [attributes.index(root_attribute)]
+    rest_attributes = list(range(num_attributes))
+    rest_attributes.remove(V[0])
+    logger.info('Adding ROOT %s', root_attribute)
+    N = []
+    # MI of the candidates scored so far. Only the candidates including the latest added attribute are new in a round.
+    mi_cache = {} if mi_cache is None else mi_cache
+    # The workers attach once to the encoded dataset, so tasks only carry attribute indices.
+    with _worker_pool(codes, cardinalities) as pool:
+        while rest_attributes:
+            start_time = perf_counter()
+            parents_pair_list = []
+
+            num_parents = min(len(V), k)
+            tasks = [(child, V, num_parents, split) for child, split in
+                     product(rest_attributes, range(len(V) - num_parents + 1))]
+            for task in tasks:
+                parents_pair_list += parents_pair_candidates(task)
+            num_cached = len(mi_cache)
+            if prune:
+                idx = select_parents_pair_with_pruning(epsilon, parents_pair_list, mi_cache, entropies,
+                                                       attr_to_is_binary, num_tuples, num_attributes, rng, pool.map)
+            else:
+                mutual_info_list = score_parents_pairs(parents_pair_list, mi_cache, pool.map)
+                if epsilon:
+                    sampling_distribution = exponential_mechanism(epsilon, mutual_info_list, parents_pair_list,
+                                                                  attr_to_is_binary, num_tuples, num_attributes)
+                    idx = rng.choice(len(mutual_info_list), p=sampling_distribution)
+                else:
+                    idx = mutual_info_list.index(max(mutual_info_list))
+
+            child, parents = parents_pair_list[idx]
+            N.append((attributes[child], [attributes[parent] for parent in parents]))
+            V.append(child)
+            rest_attributes.remove(child)
+            logger.info('Adding attribute %s', attributes[child])
+            if counts_cache is not None:
+                attribute_indices = parents + [child]
+                # e.g., the counts of an edge already found at another epsilon of a sweep
+                if tuple(attributes[idx] for idx in attribute_indices) not in counts_cache:
+                    pending_counts.append((attribute_indices,
+                                           pool.apply_async(joint_counts_worker, (attribute_indices,))))
+                pending_counts = _store_joint_counts(pending_counts, counts_cache, attributes, code_values)
+            _record_round(callback, len(N), *N[-1], len(parents_pair_list), len(mi_cache) - num_cached, start_time)
+        if counts_cache is not None:
+            _store_joint_counts(pending_counts, counts_cache, attributes, code_values, wait=True)
+
+    logger.info('BN constructed')
 
-    attr_to_is_binary = {attr: dataset[attr].unique().size <= 2 for attr in dataset}
+    return N
 
-    print('================ Constructing Bayesian Network (BN) ================')
-    root_attribute = random.choice(dataset.columns)
-    V = [root_attribute]
-    rest_attributes = list(dataset.columns)
-    rest_attributes.remove(root_attribute)
-    print(f'Adding ROOT {root_attribute}')
-    N = []
-    while rest_attributes:
-        parents_pair_list = []
-        mutual_info_list = []
 
-        num_parents = min(len(V), k)
-        tasks = [(child, V, num_parents, split, dataset) for child, split in
-                 product(rest_attributes, range(len(V) - num_parents + 1))]
-        with Pool() as pool:
-            res_list = pool.map(worker, tasks)
+def exponential_mechanism(epsilon, mutual_info_list, parents_pair_list, attr_to_is_binary, num_tuples, num_attributes):
+    """Applied in Exponential Mechanism to sample outcomes.
 
-        for res in res_list:
-            parents_pair_list += res[0]
-            mutual_info_list += res[1]
+    The delta of a candidate only takes two values (see sensitivity_lookup_table), so all candidates are scored in a
+    single expression. Scores are shifted by their maximum before np.exp (log-sum-exp), which avoids overflow at large
+    epsilon.
+    """
+    deltas = candidate_deltas(epsilon, parents_pair_list, attr_to_is_binary, num_tuples, num_attributes)
+    mi_array = np.asarray(mutual_info_list, dtype=float) / (2 * deltas)
+    mi_array = np.exp(mi_array - mi_array.max())
+    return mi_array / mi_array.sum()
 
-        if epsilon:
-            sampling_distribution = exponential_mechanism(epsilon, mutual_info_list, parents_pair_list, attr_to_is_binary,
-                                                          num_tuples, num_attributes)
-            idx = np.random.choice(list(range(len(mutual_info_list))), p=sampling_distribution)
-        else:
-            idx = mutual_info_list.index(max(mutual_info_list))
 
-        N.append(parents_pair_list[idx])
-        adding_attribute = parents_pair_list[idx][0]
-        V.append(adding_attribute)
-        rest_attributes.remove(adding_attribute)
-        print(f'Adding attribute {adding_attribute}')
+def candidate_deltas(epsilon, parents_pair_list, attr_to_is_binary, num_tuples, num_attributes):
+    """Delta of the Exponential Mechanism for each (child, parents) candidate."""
+    is_binary = np.fromiter((attr_to_is_binary[child] or (len(parents) == 1 and attr_to_is_binary[parents[0]])
+                             for child, parents in parents_pair_list), dtype=bool, count=len(parents_pair_list))
+    delta_lookup_table = calculate_delta(num_attributes, sensitivity_lookup_table(num_tuples), epsilon)
+    return delta_lookup_table[is_binary.astype(int)]
 
-    print('========================== BN constructed ==========================')
 
-    return N
+def entropies_of_codes(codes, cardinalities):
+    """Entropy (in nats, as mutual_information_of_codes) of each attribute of an encoded dataset."""
+    entropies = np.empty(len(cardinalities))
+    for idx, cardinality in enumerate(cardinalities):
+        probabilities = np.bincount(codes[:, idx], minlength=cardinality) / codes.shape[0]
+        probabilities = probabilities[probabilities > 0]
+        entropies[idx] = -(probabilities * np.log(probabilities)).sum()
+    return entropies
 
 
-def exponential_mechanism(epsilon, mutual_info_list, parents_pair_list, attr_to_is_binary, num_tuples, num_attributes):
-    """Applied in Exponential Mechanism to sample outcomes."""
-    delta_array = []
-    for (child, parents) in parents_pair_list:
-        sensitivity = calculate_sensitivity(num_tuples, child, parents, attr_to_is_binary)
-        delta = calculate_delta(num_attributes, sensitivity, epsilon)
-        delta_array.append(delta)
+def mutual_information_upper_bounds(parents_pair_list, mi_cache, entropies, num_tuples):
+    """Upper bound of the mutual information of each (child, parents) candidate, exact for the cached candidates.
 
-    mi_array = np.array(mutual_info_list) / (2 * np.array(delta_array))
-    mi_array = np.exp(mi_array)
-    mi_array = normalize_given_distribution(mi_array)
-    return mi_array
+    MI(child; parents) <= min(H(child), H(parents)), and H(parents) is at most the sum of the entropies of the parents
+    and at most log(num_tuples), as the parents take at most num_tuples distinct values in the dataset. By the chain
+    rule, MI(child; parents) <= MI(child; parents - {parent}) + H(parent) too, which is used when the subset is cached.
+    """
+    upper_bounds = np.empty(len(parents_pair_list))
+    for idx, (child, parents) in enumerate(parents_pair_list):
+        parents_set = frozenset(parents)
+        mi = mi_cache.get((child, parents_set))
+        if mi is None:
+            mi = min(entropies[child], entropies[parents].sum(), log(num_tuples))
+            for parent in parents:
+                subset_mi = mi_cache.get((child, parents_set - {parent}))
+                if subset_mi is not None:
+                    mi = min(mi, subset_mi + entropies[parent])
+        upper_bounds[idx] = mi
+    return upper_bounds
+
+
+def mutual_information_lower_bounds(parents_pair_list, mi_cache):
+    """Lower bound of the mutual information of each (child, parents) candidate, exact for the cached candidates.
+
+    MI(child; parents) >= MI(child; subset) for any subset of parents, so a candidate scores at least the MI of any
+    cached (child, subset) pair, e.g., the ones scored in the previous rounds while len(V) < k. The largest bound is a
+    lower bound of the best candidate of a round.
+    """
+    lower_bounds = np.zeros(len(parents_pair_list))
+    for idx, (child, parents) in enumerate(parents_pair_list):
+        parents = frozenset(parents)
+        mi = mi_cache.get((child, parents))
+        if mi is None:
+            mi = max((mi_cache.get((child, parents - {parent}), 0) for parent in parents), default=0)
+        lower_bounds[idx] = mi
+    return lower_bounds
+
+
+def select_parents_pair_with_pruning(epsilon, parents_pair_list, mi_cache, entropies, attr_to_is_binary, num_tuples,
+                                     num_attributes, rng, map_function=map, batch_size=64, max_proposals=4096):
+    """Index of the candidate added to the BN in a round, scoring only the candidates that may be selected.
+
+    If epsilon=0, the candidates are scored by decreasing upper bound (see mutual_information_upper_bounds), until no
+    candidate left can reach the best score. The selected candidate is the one of the argmax over all candidates, ties
+    included, since a candidate is skipped only if its upper bound is lower than the MI of a scored candidate or than
+    the lower bound of the best candidate (see mutual_information_lower_bounds).
+
+    If epsilon>0, the Exponential Mechanism is applied by rejection sampling: a candidate is proposed with probability
+    proportional to exp(upper bound / (2 * delta)) and accepted with probability exp((MI - upper bound) / (2 * delta)),
+    so only the proposed candidates are scored. Proposals are drawn until they include batch_size unscored candidates,
+    which are scored at once, and are then accepted or rejected in the order they were drawn. An accepted candidate
+    is distributed exactly as in exponential_mechanism, whatever the bounds and the number of proposals, hence the
+    privacy guarantee is unchanged; the bounds only affect the running time. A proposal is accepted with probability
+    at least exp((lower bound - upper bound) / (2 * delta)), so if that gap is large with respect to delta (large
+    epsilon, loose bounds) the rejection sampling would score about as many candidates as there are, and all
+    candidates are scored instead. The same happens if no proposal is accepted after max_proposals. Both leave the
+    output distribution unchanged, as the accepted candidate of a rejection sampler is independent of the number of
+    proposals.
+
+    Parameters
+    ----------
+    epsilon : float
+        Parameter of differential privacy.
+    parents_pair_list : list
+        List of (child, parents) candidates of a round of greedy_bayes.
+    mi_cache : dict
+        Dictionary of {(child, frozenset(parents)): mutual information}, see score_parents_pairs.
+    entropies : np.ndarray
+        Output of entropies_of_codes.
+    rng : np.random.Generator
+        Random generator of the BN construction.
+    map_function : callable
+        Function applying worker to the tasks, e.g., the map of a Pool.
+    batch_size : int
+        Number of candidates scored at once, passed as task_size to score_parents_pairs.
+    max_proposals : int
+        Maximum number of proposals of the rejection sampling.
+    """
+    upper_bounds = mutual_information_upper_bounds(parents_pair_list, mi_cache, entropies, num_tuples)
+    lower_bounds = mutual_information_lower_bounds(parents_pair_list, mi_cache)
+
+    def score(indices):
+        return np.asarray(score_parents_pairs([parents_pair_list[idx] for idx in indices], mi_cache, map_function,
+                                              batch_size))
+
+    if not epsilon:
+        scores = np.full(len(parents_pair_list), -np.inf)
+        threshold = lower_bounds.max(initial=0)
+        order = np.argsort(-upper_bounds, kind='stable')
+        for start in range(0, order.size, batch_size):
+            batch = order[start:start + batch_size]
+            batch = batch[upper_bounds[batch] >= threshold]
+            if not batch.size:
+                break
+            scores[batch] = score(batch)
+            threshold = max(threshold, scores[batch].max())
+        return int(np.argmax(scores))
+
+    deltas = candidate_deltas(epsilon, parents_pair_list, attr_to_is_binary, num_tuples, num_attributes)
+    proposal_distribution = exponential_mechanism(epsilon, upper_bounds, parents_pair_list, attr_to_is_binary,
+                                                  num_tuples, num_attributes)
+    # the bounds are equal for the cached candidates, whose score is known
+    scored = upper_bounds == lower_bounds
+    scores = lower_bounds.copy()
+    acceptance = proposal_distribution @ np.exp((lower_bounds - upper_bounds) / (2 * deltas))
+    num_proposals = 0
+    while acceptance * np.count_nonzero(~scored) >= 1 and num_proposals < max_proposals:
+        proposals, candidates = [], set()
+        num_unscored = min(batch_size, np.count_nonzero(~scored))
+        while len(candidates) < num_unscored and num_proposals < max_proposals:
+            proposals.append(rng.choice(len(parents_pair_list), size=batch_size, p=proposal_distribution))
+            candidates.update(proposals[-1][~scored[proposals[-1]]].tolist())
+            num_proposals += batch_size
+        proposals = np.concatenate(proposals)
+        candidates = sorted(candidates)
+        scores[candidates] = score(candidates)
+        scored[candidates] = True
+        uniforms = rng.random(proposals.size)
+        accepted = np.flatnonzero(uniforms < np.exp((scores[proposals] - upper_bounds[proposals])
+                                                    / (2 * deltas[proposals])))
+        if accepted.size:
+            return int(proposals[accepted[0]])
+
+    sampling_distribution = exponential_mechanism(epsilon, score(range(len(parents_pair_list))), parents_pair_list,
+                                                  attr_to_is_binary, num_tuples, num_attributes)
+    return int(rng.choice(len(parents_pair_list), p=sampling_distribution))
 
 
 def laplace_noise_parameter(k, num_attributes, num_tuples, epsilon):
@@ -319,48 +826,250 @@ def laplace_noise_parameter(k, num_attributes, num_tuples, epsilon):
     return (num_attributes - k) / epsilon
 
 
-def get_noisy_distribution_of_attributes(attributes, encoded_dataset, epsilon=0.1):
-    data = encoded_dataset.copy().loc[:, attributes]
-    data['count'] = 1
-    stats = data.groupby(attributes).sum()
-
-    iterables = [range(int(encoded_dataset[attr].max()) + 1) for attr in attributes]
-    products = product(*iterables)
+def get_noisy_distribution_of_attributes(attributes, encoded_dataset, epsilon=0.1, counts=None, rng=None):
+    """Noisy joint counts of the attributes, computed directly into a dense array.
 
-    def grouper_it(iterable, n):
-        while True:
-            chunk_it = islice(iterable, n)
-            try:
-                first_el = next(chunk_it)
-            except StopIteration:
-                return
-            yield chain((first_el,), chunk_it)
+    The counts come from np.bincount over the ravelled multi-indices of the tuples (or are a copy of the given exact
+    counts), and Laplace noise is added in place, chunk by chunk, so that no other array of the size of the domain is
+    allocated.
 
-    full_space = None
-    for item in grouper_it(products, 1000000):
-        if full_space is None:
-            full_space = DataFrame(columns=attributes, data=list(item))
-        else:
-            data_frame_append = DataFrame(columns=attributes, data=list(item))
-            full_space = pd.concat([full_space, data_frame_append], ignore_index=True)
+    Parameters
+    ----------
+    attributes : list
+        Attributes of the joint distribution, which are the axes of the returned array.
+    encoded_dataset : DataFrame
+        Input dataset encoded into binning indices.
+    epsilon : float
+        Parameter of differential privacy. Set epsilon=0 to return exact counts.
+    counts : np.ndarray, optional
+        Exact joint counts of the attributes (see get_joint_counts), which are copied instead of being counted again.
+    rng : np.random.RandomState, optional
+        Random state of the noise, by default the global one of np.random.
 
-    stats.reset_index(inplace=True)
-    stats = merge(full_space, stats, how='left')
-    stats.fillna(0, inplace=True)
+    Return
+    --------
+    np.ndarray
+        Array of shape (card_1, ..., card_m) of noisy counts, where card_i is max + 1 of the i-th attribute.
+    """
+    if counts is None:
+        stats = get_joint_counts(attributes, encoded_dataset, max_dense_cells=np.inf)
+    else:
+        stats = counts.astype(float, order='C')
+    shape, size = stats.shape, stats.size
+    stats = stats.ravel()
+    rng = np.random if rng is None else rng
 
     if epsilon:
         k = len(attributes) - 1
         num_tuples, num_attributes = encoded_dataset.shape
         noise_para = laplace_noise_parameter(k, num_attributes, num_tuples, epsilon)
-        laplace_noises = np.random.laplace(0, scale=noise_para, size=stats.index.size)
-        stats['count'] += laplace_noises
-        stats.loc[stats['count'] < 0, 'count'] = 0
+        chunk_size = 1000000
+        for start in range(0, size, chunk_size):
+            end = min(start + chunk_size, size)
+            stats[start:end] += rng.laplace(0, scale=noise_para, size=end - start)
+        np.clip(stats, 0, None, out=stats)
 
-    return stats
+    return stats.reshape(shape)
 
 
-def construct_noisy_conditional_distributions(bayesian_network, encoded_dataset, epsilon=0.1):
-    """See more in Algorithm 1 in PrivBayes."""
+def get_sparse_noisy_distribution_of_attributes(attributes, encoded_dataset, epsilon=0.1, counts=None, rng=None):
+    """Noisy joint counts of the attributes over a large domain, storing only the cells above a threshold.
+
+    Every cell of the domain receives Laplace noise, as in get_noisy_distribution_of_attributes, and then only the
+    cells whose noisy count exceeds a threshold are kept, which is post-processing of the dense mechanism. For the
+    empty cells, this is sampled in aggregate (see Cormode et al., Differentially Private Summaries for Sparse Data):
+    the number of empty cells above the threshold is binomial, they are uniformly distributed among the empty cells,
+    and, the Laplace tail being memoryless, their counts are the threshold plus exponential noise. The threshold only
+    depends on the domain size and the number of tuples, so that about num_tuples empty cells are kept at most.
+
+    The exact counts may be given as a SparseCounts, see get_joint_counts, and the noise drawn from a given
+    np.random.RandomState instead of the global one of np.random.
+
+    Return
+    --------
+    SparseCounts
+        Noisy counts of the kept cells, whose axes are the attributes.
+    """
+    if counts is None:
+        counts = get_joint_counts(attributes, encoded_dataset, max_dense_cells=0)
+    shape = counts.shape
+    observed_cells = counts.cells
+    counts = counts.counts.astype(float)
+
+    if not epsilon:
+        return SparseCounts(shape, observed_cells, counts)
+
+    k = len(attributes) - 1
+    num_tuples, num_attributes = encoded_dataset.shape
+    noise_para = laplace_noise_parameter(k, num_attributes, num_tuples, epsilon)
+    size = domain_size(shape)
+    threshold = noise_para * max(log(size / (2 * num_tuples)), 0)
+
+    rng = np.random if rng is None else rng
+    counts += rng.laplace(0, scale=noise_para, size=counts.size)
+    kept = counts > threshold
+
+    num_empty_cells = size - observed_cells.shape[0]
+    num_noisy_empty_cells = rng.binomial(num_empty_cells, 0.5 * exp(-threshold / noise_para))
+    noisy_empty_cells = sample_empty_cells(shape, observed_cells, num_noisy_empty_cells, rng)
+    noisy_empty_counts = threshold + rng.exponential(noise_para, size=num_noisy_empty_cells)
+
+    cells = np.concatenate([observed_cells[kept], noisy_empty_cells])
+    counts = np.concatenate([counts[kept], noisy_empty_counts])
+    return SparseCounts(shape, cells, counts)
+
+
+class JointCountsCache:
+    """Exact joint counts of sets of attributes, shared by greedy_bayes and construct_noisy_conditional_distributions,
+    so that the counts of an edge of the BN are not computed again when noise is injected.
+
+    The counts of a set of attributes are found whatever the order of the attributes, and the least recently used
+    counts are evicted once all counts take more than max_bytes.
+
+    Attributes
+    ----------
+    max_bytes : int
+        Maximum memory of the cached counts, in bytes.
+    nbytes : int
+        Memory of the cached counts, in bytes.
+    """
+
+    def __init__(self, max_bytes=1 << 30):
+        self.max_bytes: int = max_bytes
+        self.nbytes: int = 0
+        # {frozenset of attributes: (list of attributes, i.e., the axes of the counts, counts)}
+        self._entries = OrderedDict()
+        # the cache is shared by the threads of construct_noisy_conditional_distributions
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, attributes):
+        return frozenset(attributes) in self._entries
+
+    def get(self, attributes, default=None):
+        """Counts of the attributes, whose axes are in the order of `attributes`, or default if they are not cached."""
+        key = frozenset(attributes)
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            cached_attributes, counts = self._entries[key]
+        axes = [cached_attributes.index(attr) for attr in attributes]
+        return counts if axes == sorted(axes) else counts.transpose(axes)
+
+    def __setitem__(self, attributes, counts):
+        key = frozenset(attributes)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1].nbytes
+            self._entries[key] = (list(attributes), counts)
+            self.nbytes += counts.nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_counts) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_counts.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+def get_joint_counts(attributes, encoded_dataset, max_dense_cells=MAX_DENSE_CELLS):
+    """Exact joint counts of the attributes, as a dense array of floats, or as a SparseCounts of the non-zero cells
+    when the domain has more than max_dense_cells cells.
+
+    Rows with a negative binning index, i.e., a value out of the numerical range of an attribute, are not counted.
+    """
+    shape = tuple(int(encoded_dataset[attr].max()) + 1 for attr in attributes)
+    columns = [encoded_dataset[attr].to_numpy() for attr in attributes]
+    in_range = np.logical_and.reduce([column >= 0 for column in columns])
+    if not in_range.all():
+        columns = [column[in_range] for column in columns]
+    keys = np.ravel_multi_index(columns, shape)
+    if domain_size(shape) > max_dense_cells:
+        keys, counts = np.unique(keys, return_counts=True)
+        cells = np.column_stack(np.unravel_index(keys, shape)).reshape(-1, len(shape))
+        return SparseCounts(shape, cells, counts.astype(float))
+    return np.bincount(keys, minlength=domain_size(shape)).astype(float).reshape(shape)
+
+
+def get_noisy_joint_counts(attributes, encoded_dataset, epsilon=0.1, max_dense_cells=MAX_DENSE_CELLS,
+                           counts_cache=None, rng=None):
+    """Noisy joint counts of the attributes, which are sparse when the domain has more than max_dense_cells cells.
+
+    If counts_cache is given, i.e., a JointCountsCache or a dictionary of {tuple of attributes: exact joint counts},
+    the exact counts are looked up in it before noise is added, and stored into it when they are missing. The noise is
+    drawn from rng, a np.random.RandomState, if given.
+    """
+    counts = None if counts_cache is None else counts_cache.get(tuple(attributes))
+    if counts is None:
+        counts = get_joint_counts(attributes, encoded_dataset, max_dense_cells)
+        if counts_cache is not None:
+            counts_cache[tuple(attributes)] = counts
+    if isinstance(counts, SparseCounts):
+        return get_sparse_noisy_distribution_of_attributes(attributes, encoded_dataset, epsilon, counts, rng)
+    else:
+        return get_noisy_distribution_of_attributes(attributes, encoded_dataset, epsilon, counts, rng)
+
+
+def get_marginal_of_attributes(stats, stats_attributes, attributes, max_dense_cells=MAX_DENSE_CELLS):
+    """Sum joint counts over the attributes not in `attributes`, with axes in the order of `attributes`.
+
+    Sparse counts stay sparse unless their marginal has at most max_dense_cells cells.
+    """
+    if isinstance(stats, SparseCounts):
+        marginal = stats.marginal([stats_attributes.index(attr) for attr in attributes])
+        return marginal.to_dense() if marginal.size <= max_dense_cells else marginal
+
+    summed_axes = tuple(idx for idx, attr in enumerate(stats_attributes) if attr not in attributes)
+    kept_attributes = [attr for attr in stats_attributes if attr in attributes]
+    marginal = stats.sum(axis=summed_axes) if summed_axes else stats
+    return marginal.transpose([kept_attributes.index(attr) for attr in attributes])
+
+
+def normalize_along_last_axis(stats):
+    """Normalize counts into distributions along the last axis, which is uniform where all counts are zero."""
+    if isinstance(stats, SparseCounts):
+        return SparseConditionalDistribution.from_counts(stats)
+
+    stats = np.clip(stats, 0, None)
+    summation = stats.sum(axis=-1, keepdims=True)
+    uniform = np.full_like(stats, 1 / stats.shape[-1])
+    return np.divide(stats, summation, out=uniform, where=summation > 0)
+
+
+def construct_noisy_conditional_distributions(bayesian_network, encoded_dataset, epsilon=0.1,
+                                              max_dense_cells=MAX_DENSE_CELLS, counts_cache=None, seed=None,
+                                              num_workers=1):
+    """See more in Algorithm 1 in PrivBayes.
+
+    Noisy joint counts over more than max_dense_cells cells are computed sparsely, in which case the conditional
+    distributions of the child are a SparseConditionalDistribution. The exact joint counts are reused from
+    counts_cache if given, see get_noisy_joint_counts.
+
+    The noisy joint counts of the first k+1 attributes and of each child after them are independent, and are computed
+    concurrently by num_workers threads sharing encoded_dataset and counts_cache; numpy releases the GIL while
+    counting, injecting noise and normalizing. Each of them then draws its noise from its own np.random.RandomState,
+    spawned from seed, so that the output only depends on seed, whatever num_workers. If seed is None, it is drawn
+    from the global random state of np.random, unless num_workers=1, in which case all noise is drawn from the global
+    random state one child after the other.
+
+    Parameters
+    ----------
+    seed : int, optional
+        Seed of the random states of the children.
+    num_workers : int
+        Number of threads, or None for the number of CPUs.
+
+    Return
+    --------
+    dict
+        Dictionary of {root: 1-D array, child: array}, where the array of a child has one axis per parent (in the order
+        of the parents in bayesian_network) followed by the child axis, which sums to 1. Use
+        conditional_distributions_to_json to get the JSON form of the dataset description.
+    """
 
     k = len(bayesian_network[-1][1])
     conditional_distributions = {}
@@ -371,30 +1080,137 @@ def construct_noisy_conditional_distributions(bayesian_network, encoded_dataset,
     for child, _ in bayesian_network[:k]:
         kplus1_attributes.append(child)
 
-    noisy_dist_of_kplus1_attributes = get_noisy_distribution_of_attributes(kplus1_attributes, encoded_dataset, epsilon)
+    # the noisy joint counts of the first k+1 attributes, then the conditional distributions of the other children
+    tasks = [kplus1_attributes] + [parents + [child] for child, parents in bayesian_network[k:]]
+    if seed is None and num_workers == 1:
+        rngs = [None] * len(tasks)
+    else:
+        if seed is None:
+            seed = np.random.randint(2 ** 31)
+        rngs = [np.random.RandomState(int(child_seed.generate_state(1)[0]))
+                for child_seed in np.random.SeedSequence(seed).spawn(len(tasks))]
+
+    def noisy_distributions(paras):
+        attributes, rng = paras
+        stats = get_noisy_joint_counts(attributes, encoded_dataset, epsilon, max_dense_cells, counts_cache, rng)
+        return stats if attributes is kplus1_attributes else normalize_along_last_axis(stats)
+
+    if num_workers == 1:
+        results = list(map(noisy_distributions, zip(tasks, rngs)))
+    else:
+        with ThreadPool(num_workers) as pool:
+            results = pool.map(noisy_distributions, list(zip(tasks, rngs)), chunksize=1)
+    noisy_dist_of_kplus1_attributes = results[0]
 
     # generate noisy distribution of root attribute.
-    root_stats = noisy_dist_of_kplus1_attributes.loc[:, [root, 'count']].groupby(root).sum()['count']
-    conditional_distributions[root] = normalize_given_distribution(root_stats).tolist()
+    root_stats = get_marginal_of_attributes(noisy_dist_of_kplus1_attributes, kplus1_attributes, [root],
+                                            max_dense_cells)
+    conditional_distributions[root] = normalize_along_last_axis(root_stats)
 
     for idx, (child, parents) in enumerate(bayesian_network):
-        conditional_distributions[child] = {}
+        if idx <= k - 1:
+            stats = get_marginal_of_attributes(noisy_dist_of_kplus1_attributes, kplus1_attributes, parents + [child],
+                                               max_dense_cells)
+            conditional_distributions[child] = normalize_along_last_axis(stats)
+        else:
+            conditional_distributions[child] = results[idx - k + 1]
+
+    return conditional_distributions
 
-        if idx <= k - 2:
-            stats = noisy_dist_of_kplus1_attributes.copy().loc[:, parents + [child, 'count']]
-            stats = stats.groupby(parents + [child], as_index=False).sum()
-        elif idx == k - 1:
-            stats = noisy_dist_of_kplus1_attributes.loc[:, parents + [child, 'count']]
+
+def conditional_distributions_to_json(bayesian_network, conditional_distributions):
+    """Convert the output of construct_noisy_conditional_distributions into its JSON form.
+
+    The distribution of the root is a list, and the distributions of a child are a dictionary of {str(list of parent
+    values): list}, e.g., {"[0, 1]": [0.2, 0.8]}. A SparseConditionalDistribution only lists its parent values, and
+    DataGenerator samples the other ones from unlisted_parents_distribution, as sample_child does.
+    """
+    root = bayesian_network[0][1][0]
+    conditional_distributions_in_json = {root: conditional_distributions[root].tolist()}
+    for child, _ in bayesian_network:
+        distributions = conditional_distributions[child]
+        if isinstance(distributions, SparseConditionalDistribution):
+            parents_instances = distributions.parents_instances.tolist()
+            rows = distributions.distributions.tolist()
         else:
-            stats = get_noisy_distribution_of_attributes(parents + [child], encoded_dataset, epsilon)
-            stats = stats.loc[:, parents + [child, 'count']]
+            parents_instances = np.ndindex(*distributions.shape[:-1])
+            rows = distributions.reshape(-1, distributions.shape[-1]).tolist()
+        conditional_distributions_in_json[child] = {str(list(parents_instance)): dist for parents_instance, dist in
+                                                    zip(parents_instances, rows)}
+    return conditional_distributions_in_json
 
-        parents_grouper = parents[0] if len(parents) == 1 else parents
-        for parents_instance, stats_sub in stats.groupby(parents_grouper):
-            stats_sub = stats_sub.sort_values(by=child)
-            dist = normalize_given_distribution(stats_sub['count']).tolist()
 
-            parents_key = str([parents_instance]) if len(parents) == 1 else str(list(parents_instance))
-            conditional_distributions[child][parents_key] = dist
+def compile_conditional_distributions(distributions):
+    """Cumulative form of the conditional distributions of a child, for inverse-CDF sampling with sample_child.
 
-    return conditional_distributions
+    Parameters
+    ----------
+    distributions : np.ndarray or SparseConditionalDistribution
+        Conditional distributions of a child, as returned by construct_noisy_conditional_distributions.
+
+    Return
+    --------
+    tuple
+        (parents_shape, parents_keys, cumulative). cumulative is an array of shape (num_rows, child cardinality) of
+        cumulative distributions, where row i is shifted by i so that the array is sorted when ravelled. parents_keys is
+        None when row i is the distribution of the i-th ravelled parent value, otherwise it is the sorted array of
+        ravelled parent values of the rows, and the last row is the distribution of the other parent values, see
+        unlisted_parents_distribution.
+    """
+    if isinstance(distributions, SparseConditionalDistribution):
+        parents_shape = distributions.shape[:-1]
+        parents_keys = np.ravel_multi_index(tuple(distributions.parents_instances.T), parents_shape)
+        table = np.vstack([distributions.distributions, unlisted_parents_distribution(distributions.shape[-1])])
+    else:
+        parents_shape = distributions.shape[:-1]
+        parents_keys = None
+        table = distributions.reshape(-1, distributions.shape[-1])
+    return compile_distribution_table(parents_shape, parents_keys, table)
+
+
+def compile_distribution_table(parents_shape, parents_keys, table):
+    """Compile a table of distributions, one per row, into the output of compile_conditional_distributions.
+
+    Parameters
+    ----------
+    parents_shape : tuple
+        Cardinalities of the parents.
+    parents_keys : np.ndarray or None
+        Sorted ravelled parent values of the rows but the last one, which is the distribution of the other parent
+        values. None if row i is the distribution of the i-th ravelled parent value.
+    table : np.ndarray
+        Array of shape (num_rows, child cardinality) of distributions.
+    """
+    cumulative = np.cumsum(table, axis=1)
+    cumulative[:, -1] = 1
+    cumulative += np.arange(table.shape[0])[:, np.newaxis]
+    return parents_shape, parents_keys, cumulative
+
+
+def sample_child(compiled_distributions, parents_codes, uniforms):
+    """Sample the codes of a child for all rows at once, by inverse-CDF lookup into its compiled distributions.
+
+    Parameters
+    ----------
+    compiled_distributions : tuple
+        Output of compile_conditional_distributions.
+    parents_codes : list
+        Arrays of the codes of the parents, in the order of the parents in the Bayesian network. Empty for the root.
+    uniforms : np.ndarray
+        Uniform random numbers in [0, 1), one per row.
+    """
+    parents_shape, parents_keys, cumulative = compiled_distributions
+    if parents_codes:
+        # mixed-radix index of the parent values of each row
+        rows = np.ravel_multi_index(tuple(parents_codes), parents_shape)
+    else:
+        rows = np.zeros(uniforms.size, dtype=np.int64)
+
+    if parents_keys is not None:
+        positions = np.searchsorted(parents_keys, rows)
+        found = positions < parents_keys.size
+        found[found] = parents_keys[positions[found]] == rows[found]
+        rows = np.where(found, positions, parents_keys.size)
+
+    child_cardinality = cumulative.shape[1]
+    return np.searchsorted(cumulative.ravel(), rows + uniforms, side='right') - rows * child_cardinality
@@ -1,14 +1,117 @@
+from typing import Dict, List
 
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from src.original_priv_bayes import greedy_bayes, construct_noisy_conditional_distributions, \
+    compile_conditional_distributions, sample_child, JointCountsCache
 
 
 class PrivBayes:
-    def __init__(self, degree, seed=42):
+    """Differentially private Bayesian network, fitted once on a dataset and then sampled as many times as needed.
+
+    Attributes
+    ----------
+    k : int
+        Maximum number of parents in the Bayesian network. If k=0, k is automatically calculated.
+    seed : int
+        Seed for the randomness in fitting and, unless another seed is given, in sampling.
+    epsilon : float
+        Parameter of differential privacy, split in half between network learning and conditional distributions.
+        Set epsilon=0 to turn off differential privacy.
+    attributes : list
+        Attributes of the fitted dataset, in their original order.
+    categories : dict
+        Dictionary of {attribute: np.ndarray}, the values of each attribute indexed by their integer codes.
+    bayesian_network : list
+        List of (child, [parent,]) to represent the Bayesian network.
+    conditional_distributions : dict
+        Dictionary of {attribute: array} of the noisy conditional distributions of the Bayesian network.
+    """
+
+    def __init__(self, degree, seed=42, epsilon=0.1):
         self.k = degree
         self.seed = seed
+        self.epsilon = epsilon
+
+        self.attributes: List = None
+        self.categories: Dict[str, np.ndarray] = None
+        self.bayesian_network: List = None
+        self.conditional_distributions: Dict = None
+        self._sampling_order: List = None
+        self._compiled_distributions: Dict = None
+        self._rng = np.random.default_rng(seed)
+
+    def fit(self, data: DataFrame):
+        """Encode the data once, learn the Bayesian network and build its noisy conditional distributions."""
+        if data.shape[1] < 2:
+            raise Exception("PrivBayes requires at least 2 attributes(i.e., columns) in dataset.")
+
+        self.attributes = list(data.columns)
+        encoded, cardinalities = self.encode(data)
+        codes = np.asfortranarray(encoded.to_numpy())
+
+        counts_cache = JointCountsCache()
+        self.greedy_bayes(encoded, codes=codes, cardinalities=cardinalities, counts_cache=counts_cache)
+        self.conditional_distributions = construct_noisy_conditional_distributions(self.bayesian_network, encoded,
+                                                                                   self.epsilon / 2,
+                                                                                   counts_cache=counts_cache)
+
+        root = self.bayesian_network[0][1][0]
+        self._sampling_order = [(root, [])] + [(child, parents) for child, parents in self.bayesian_network]
+        self._compiled_distributions = {attr: compile_conditional_distributions(self.conditional_distributions[attr])
+                                        for attr, _ in self._sampling_order}
+        self._rng = np.random.default_rng(self.seed)
+        return self
+
+    def encode(self, data: DataFrame):
+        """Factorize every attribute into integer codes, recording their values in self.categories.
+
+        Missing values are encoded as the last code of the attribute.
+        """
+        self.categories = {}
+        attr_to_codes = {}
+        cardinalities = np.empty(data.shape[1], dtype=np.int64)
+        for idx, attr in enumerate(data):
+            codes, uniques = pd.factorize(data[attr])
+            categories = np.asarray(uniques)
+            missing = codes < 0
+            if missing.any():
+                codes[missing] = categories.size
+                categories = np.append(categories.astype(object), np.nan)
+            self.categories[attr] = categories
+            attr_to_codes[attr] = codes.astype(np.int64, copy=False)
+            cardinalities[idx] = categories.size
+        return DataFrame(attr_to_codes), cardinalities
+
+    def greedy_bayes(self, data: DataFrame, codes=None, cardinalities=None, counts_cache=None):
+        """Learn the Bayesian network of the encoded data with half of the privacy budget."""
+        self.bayesian_network = greedy_bayes(data, self.k, self.epsilon / 2, seed=self.seed, codes=codes,
+                                             cardinalities=cardinalities, counts_cache=counts_cache)
+        return self.bayesian_network
 
-    def greedy_bayes(self, data):
-        pass
-        print()
+    def sample(self, n, seed=None):
+        """Sample n synthetic rows from the fitted model, without refitting.
 
+        Parameters
+        ----------
+        n : int
+            Number of rows to sample.
+        seed : int, optional
+            Seed of this sample. By default, successive calls continue the random stream seeded by self.seed.
+        """
+        if self._compiled_distributions is None:
+            raise Exception('PrivBayes must be fitted before sampling.')
 
+        rng = self._rng if seed is None else np.random.default_rng(seed)
+        codes = self.sample_codes(n, rng)
+        return DataFrame({attr: self.categories[attr][codes[attr]] for attr in self.attributes})
 
+    def sample_codes(self, n, rng):
+        """Ancestral sampling of the integer codes of n rows, one vectorized draw per attribute."""
+        codes = {}
+        for attr, parents in self._sampling_order:
+            parents_codes = [codes[parent] for parent in parents]
+            codes[attr] = sample_child(self._compiled_distributions[attr], parents_codes, rng.random(n))
+        return codes
@@ -0,0 +1,137 @@
+import numpy as np
+
+"""
+Sparse representations of the joint counts and conditional distributions of PrivBayes, used when the domain of a set
+of attributes is too large to be materialised.
+"""
+
+
+def domain_size(shape):
+    """Number of cells of a domain, computed with Python integers to avoid overflows."""
+    size = 1
+    for cardinality in shape:
+        size *= int(cardinality)
+    return size
+
+
+def sample_empty_cells(shape, observed_cells, num_cells, rng=None):
+    """Sample distinct cells uniformly at random among the cells of the domain that are not observed.
+
+    Parameters
+    ----------
+    shape : tuple
+        Cardinalities of the attributes.
+    observed_cells : np.ndarray
+        Array of shape (num_observed_cells, len(shape)) of the multi-indices of the observed cells.
+    num_cells : int
+        Number of cells to sample, which is much smaller than the number of empty cells.
+    rng : np.random.RandomState, optional
+        Random state of the sampling, by default the global one of np.random.
+
+    Return
+    --------
+    np.ndarray
+        Array of shape (num_cells, len(shape)) of multi-indices.
+    """
+    rng = np.random if rng is None else rng
+    size = domain_size(shape)
+    observed = np.ravel_multi_index(tuple(observed_cells.T), shape) if observed_cells.size else np.empty(0, dtype=int)
+    sampled = np.empty(0, dtype=np.int64)
+    while sampled.size < num_cells:
+        candidates = rng.randint(0, size, size=2 * (num_cells - sampled.size), dtype=np.int64)
+        candidates = candidates[~np.isin(candidates, observed)]
+        sampled = np.union1d(sampled, candidates)
+    if sampled.size > num_cells:
+        sampled = rng.choice(sampled, size=num_cells, replace=False)
+    return np.column_stack(np.unravel_index(sampled, shape)).reshape(-1, len(shape))
+
+
+def unlisted_parents_distribution(child_cardinality):
+    """Distribution of a child given parent values that its conditional distributions do not list, e.g., the parent
+    values without noisy counts of a SparseConditionalDistribution. It is uniform, as the normalized all-zero row of
+    a dense array, so that a model is sampled alike from its dense or sparse form, in memory or from its description.
+    """
+    return np.full(child_cardinality, 1 / child_cardinality)
+
+
+class SparseCounts:
+    """Joint counts over a large domain, where only the listed cells are non-zero.
+
+    Attributes
+    ----------
+    shape : tuple
+        Cardinalities of the attributes, i.e., the shape of the equivalent dense array.
+    cells : np.ndarray
+        Array of shape (num_cells, num_attributes) of the distinct multi-indices of the non-zero cells.
+    counts : np.ndarray
+        Counts of the cells.
+    """
+
+    def __init__(self, shape, cells, counts):
+        self.shape = tuple(int(cardinality) for cardinality in shape)
+        self.cells: np.ndarray = cells
+        self.counts: np.ndarray = counts
+
+    @property
+    def size(self):
+        return domain_size(self.shape)
+
+    def marginal(self, axes):
+        """Sum the counts over the axes that are not in `axes`, whose order is kept in the result."""
+        shape = tuple(self.shape[axis] for axis in axes)
+        keys = np.ravel_multi_index(tuple(self.cells[:, axes].T), shape)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=self.counts, minlength=keys.size)
+        cells = np.column_stack(np.unravel_index(keys, shape)).reshape(-1, len(shape))
+        return SparseCounts(shape, cells, counts)
+
+    def transpose(self, axes):
+        """Permute the axes, as np.transpose, keeping the cells sorted lexicographically."""
+        shape = tuple(self.shape[axis] for axis in axes)
+        cells = self.cells[:, axes]
+        order = np.argsort(np.ravel_multi_index(tuple(cells.T), shape), kind='stable')
+        return SparseCounts(shape, cells[order], self.counts[order])
+
+    @property
+    def nbytes(self):
+        return self.cells.nbytes + self.counts.nbytes
+
+    def to_dense(self):
+        stats = np.zeros(self.shape)
+        stats[tuple(self.cells.T)] = self.counts
+        return stats
+
+
+class SparseConditionalDistribution:
+    """Conditional distributions of a child attribute, listed for the parent values with non-zero counts.
+
+    The distribution of any other parent value is unlisted_parents_distribution.
+
+    Attributes
+    ----------
+    shape : tuple
+        Cardinalities of the parents followed by the cardinality of the child.
+    parents_instances : np.ndarray
+        Array of shape (num_instances, num_parents) of the distinct listed parent values, sorted lexicographically.
+    distributions : np.ndarray
+        Array of shape (num_instances, child cardinality) of the distributions of the child.
+    """
+
+    def __init__(self, shape, parents_instances, distributions):
+        self.shape = tuple(int(cardinality) for cardinality in shape)
+        self.parents_instances: np.ndarray = parents_instances
+        self.distributions: np.ndarray = distributions
+
+    @staticmethod
+    def from_counts(stats: SparseCounts):
+        """Normalize sparse joint counts, whose last axis is the child, along the child axis."""
+        parents_shape = stats.shape[:-1]
+        keys = np.ravel_multi_index(tuple(stats.cells[:, :-1].T), parents_shape)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.zeros((keys.size, stats.shape[-1]))
+        counts[inverse.ravel(), stats.cells[:, -1]] = stats.counts
+        summation = counts.sum(axis=1, keepdims=True)
+        uniform = np.full_like(counts, 1 / stats.shape[-1])
+        distributions = np.divide(counts, summation, out=uniform, where=summation > 0)
+        parents_instances = np.column_stack(np.unravel_index(keys, parents_shape)).reshape(-1, len(parents_shape))
+        return SparseConditionalDistribution(stats.shape, parents_instances, distributions)